@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Compare the CoT timestamp parser and formatter against dateutil.
+
+Usage: python3 bench/bench_cottime.py
+"""
+import timeit
+from datetime import datetime as dt
+
+from dateutil.parser import isoparse
+
+from taky.util import parse_cot_time, format_cot_time
+
+STAMP = "2021-02-27T20:32:24.771Z"
+NUMBER = 100000
+
+
+def report(name, func):
+    secs = min(timeit.repeat(func, number=NUMBER, repeat=5))
+    usec = secs / NUMBER * 1e6
+    print(f"{name:<28} {usec:8.3f} us")
+    return usec
+
+
+def main():
+    print(f"Parsing {STAMP!r}, best of 5 x {NUMBER}")
+    slow = report("isoparse", lambda: isoparse(STAMP).replace(tzinfo=None))
+    fast = report("parse_cot_time", lambda: parse_cot_time(STAMP))
+    print(f"Speedup: {slow / fast:.1f}x")
+    print()
+
+    ts = dt(2021, 2, 27, 20, 32, 24, 771000)
+    print("Formatting a timestamp")
+    slow = report("isoformat", lambda: ts.isoformat(timespec="milliseconds") + "Z")
+    fast = report("format_cot_time (cached)", lambda: format_cot_time(ts))
+    print(f"Speedup: {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare EventFramer against XMLDeclStrip and a primed XMLPullParser, for a
+stream of ATAK style events (each one a document with a declaration).
+
+Both sides produce what TAKClient.feed() needs: the event element, and the
+event as bytes.
+
+Usage: python3 bench/bench_framer.py
+"""
+import timeit
+
+from lxml import etree
+
+from taky.util import EventFramer, XMLDeclStrip
+
+EVENT = (
+    b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+    b'<event version="2.0" uid="ANDROID-deadbeef" type="a-f-G-U-C" '
+    b'time="2021-02-27T20:32:24.771Z" start="2021-02-27T20:32:24.771Z" '
+    b'stale="2021-02-27T20:38:39.771Z" how="h-e"><point lat="1.234567" '
+    b'lon="-3.141592" hae="-25.7" ce="9.9" le="9999999.0"/><detail><takv '
+    b'os="29" version="4.0.0.0 (deadbeef).1234567890-CIV" device="Some '
+    b'Android Device" platform="ATAK-CIV"/><contact endpoint="*:-1:stcp" '
+    b'callsign="JENNY"/><uid Droid="JENNY"/><precisionlocation altsrc="GPS" '
+    b'geopointsrc="GPS"/><__group role="Team Member" name="Cyan"/><status '
+    b'battery="78"/><track course="80.24833892285461" speed="0.0"/></detail>'
+    b"</event>"
+)
+EVENTS = 1000
+NUMBER = 20
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def run_xdc(chunks):
+    parser = etree.XMLPullParser(tag="event", resolve_entities=False)
+    parser.feed(b"<root>")
+    xdc = XMLDeclStrip(parser)
+    for chunk in chunks:
+        xdc.feed(chunk)
+        for (_, elm) in xdc.read_events():
+            etree.tostring(elm, with_tail=False)
+            elm.clear(keep_tail=True)
+
+
+def run_framer(chunks):
+    framer = EventFramer()
+    parser = etree.XMLParser(resolve_entities=False)
+    for chunk in chunks:
+        framer.feed(chunk)
+        for frame in framer.read_frames():
+            etree.fromstring(frame, parser)
+
+
+def report(name, func):
+    secs = min(timeit.repeat(func, number=NUMBER, repeat=5))
+    usec = secs / NUMBER / EVENTS * 1e6
+    print(f"  {name:<14} {usec:8.2f} us/event")
+    return usec
+
+
+def main():
+    stream = EVENT * EVENTS
+    print(f"{EVENTS} events, best of 5 x {NUMBER}")
+    for size in [64, 1500, 65536]:
+        chunks = chunked(stream, size)
+        print(f"{size} byte reads")
+        slow = report("XMLDeclStrip", lambda: run_xdc(chunks))
+        fast = report("EventFramer", lambda: run_framer(chunks))
+        print(f"  Speedup: {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Measure the memory used per event by the in-memory persistence store.
+
+Events are received the way TAKClient.feed() handles them, then tracked by
+the store. Each mode runs in a fresh interpreter, and reports the growth of
+its peak RSS (which includes memory held by libxml2) divided by the number
+of events.
+
+The baseline mode keeps each event as a full models.Event, with the lxml
+tree of its detail, as the store did before events were compacted.
+
+Usage: python3 bench/bench_persist_mem.py [num_events]
+"""
+import gc
+import os
+import sys
+import resource
+import subprocess
+from datetime import datetime as dt
+from datetime import timedelta
+
+from lxml import etree
+
+from taky.config import load_config
+from taky.cot import models
+from taky.cot.persistence import Persistence
+
+MODES = ["baseline", "memory", "binary"]
+XML = (
+    '<event version="2.0" uid="ANDROID-{idx:08x}" type="a-f-G-U-C" '
+    'time="{now}" start="{now}" stale="{stale}" how="h-e">'
+    '<point lat="{lat:.6f}" lon="-77.000000" hae="9999999.0" ce="9999999.0" '
+    'le="9999999.0"/><detail><takv os="29" version="4.0.0.1" '
+    'device="SAMSUNG SM-G950U" platform="ATAK-CIV"/><contact '
+    'endpoint="*:-1:stcp" callsign="USER{idx}"/><uid Droid="USER{idx}"/>'
+    '<precisionlocation altsrc="GPS" geopointsrc="GPS"/><__group role="Team '
+    'Member" name="Cyan"/><status battery="78"/><track course="0.0" '
+    'speed="0.0"/></detail></event>'
+)
+
+
+def max_rss():
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run(mode, num):
+    load_config(os.devnull)
+    now = dt.utcnow()
+    stamps = {
+        "now": now.isoformat() + "Z",
+        "stale": (now + timedelta(days=1)).isoformat() + "Z",
+    }
+    docs = [XML.format(idx=idx, lat=idx / num, **stamps).encode() for idx in range(num)]
+    persist = Persistence(binary=(mode == "binary"))
+    events = {}
+
+    gc.collect()
+    before = max_rss()
+    for data in docs:
+        elm = etree.fromstring(data)
+        if mode == "baseline":
+            evt = models.Event.from_elm(elm, wire=data)
+            events[evt.uid] = evt
+            continue
+
+        evt = models.LazyEvent.from_elm(elm, wire=data)
+        evt.detail  # pylint: disable=pointless-statement
+        persist.track(evt)
+        elm.clear()
+    del evt, elm
+    gc.collect()
+
+    return (max_rss() - before) / num
+
+
+def main():
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    if len(sys.argv) > 2:
+        print(run(sys.argv[2], num))
+        return
+
+    print(f"Persisting {num} events")
+    for mode in MODES:
+        out = subprocess.check_output([sys.executable, __file__, str(num), mode])
+        print(f"{mode:<10} {float(out):8.0f} bytes/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -34,6 +34,43 @@ def status_reg(subp):
 def print_status(stat):
     print("Uptime:", seconds_to_human(stat.get("uptime", -1)))
     print("Num Clients: %d" % stat.get("num_clients", -1))
+    print("Dropped Events: %d" % stat.get("tx_dropped", 0))
+
+    persist = stat.get("persistence", {})
+    if "events" in persist:
+        print("Persisted Events: %d" % persist["events"])
+    if "binary_saved" in persist:
+        print(
+            "Persistence Size: %d bytes (%d bytes saved by packing)"
+            % (persist["stored_bytes"], persist["binary_saved"])
+        )
+    if "binary_written_saved" in persist:
+        print(
+            "Bytes Saved by Packing: %d (all writes since startup)"
+            % persist["binary_written_saved"]
+        )
+    if "cache_hits" in persist:
+        print(
+            "Persistence Cache: %d events (%d hits, %d misses)"
+            % (persist["cached"], persist["cache_hits"], persist["cache_misses"])
+        )
+    if "duplicates" in persist:
+        print("Duplicate Events: %d" % persist["duplicates"])
+    if "queue_depth" in persist:
+        print(
+            "Persistence Queue: %d (last flush %.1f ms)"
+            % (persist["queue_depth"], persist.get("flush_latency", 0) * 1000)
+        )
+    if "queued" in persist:
+        print(
+            "Write Behind: %d queued, %d coalesced, %d dropped, %d failed"
+            % (
+                persist["queued"],
+                persist["coalesced"],
+                persist["dropped"],
+                persist["failed"],
+            )
+        )
     print()
 
     clients = stat.get("clients")
@@ -71,20 +108,17 @@ def print_status(stat):
     pprinttable(table)
 
 
-def status(args):
-    try:
-        load_config(args.cfg_file)
-    except (OSError, configparser.ParsingError) as exc:
-        print(exc, file=sys.stderr)
-        sys.exit(1)
-
-    if args.socket is None:
-        args.socket = os.path.join(config.get("taky", "root_dir"), "taky-mgmt.sock")
+def query_status(path):
+    """
+    Request the status from a management socket
 
+    @param path The path of the management socket
+    @return The decoded status, or None if the server did not respond
+    """
     start = time.time()
     sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     try:
-        sock.connect(args.socket)
+        sock.connect(path)
         cmd = json.dumps({"cmd": "status"}).encode()
         sock.sendall(cmd + b"\0")
 
@@ -109,34 +143,72 @@ def status(args):
                 continue
 
         sock.shutdown(socket.SHUT_RDWR)
+    finally:
+        sock.close()
 
-        if not done:
-            print("ERROR: No response from server", file=sys.stderr)
-            return 1
+    if not done:
+        return None
 
-        data = data[:-1].decode()
-        stat = json.loads(data)
+    return json.loads(data[:-1].decode())
 
-        if args.json:
-            print(json.dumps(stat))
-        else:
-            print_status(stat)
-    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
-        print(f"ERROR: Invalid data in response: {exc}", file=sys.stderr)
-        return 1
-    except FileNotFoundError as exc:
-        print(
-            f"ERROR: Unable to connect to mgmt socket: {args.socket}", file=sys.stderr
-        )
-        print("       Is taky running?", file=sys.stderr)
-        return 1
-    except socket.error as exc:
-        print("ERROR: Socket error:", exc)
-        if exc.errno in [2, 111]:
+
+def merge_status(stats):
+    """
+    Combine the status of several workers. Each worker reports its own
+    clients. The persistence status is taken from the first worker.
+    """
+    ret = dict(stats[0])
+    ret["clients"] = list(ret.get("clients", []))
+    for stat in stats[1:]:
+        ret["num_clients"] = ret.get("num_clients", 0) + stat.get("num_clients", 0)
+        ret["tx_dropped"] = ret.get("tx_dropped", 0) + stat.get("tx_dropped", 0)
+        ret["clients"].extend(stat.get("clients", []))
+
+    return ret
+
+
+def status(args):
+    try:
+        load_config(args.cfg_file)
+    except (OSError, configparser.ParsingError) as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(1)
+
+    if args.socket is None:
+        # Each worker has its own management socket
+        root_dir = config.get("taky", "root_dir")
+        paths = [os.path.join(root_dir, "taky-mgmt.sock")]
+        for idx in range(1, config.getint("cot_server", "workers")):
+            paths.append(os.path.join(root_dir, f"taky-mgmt-{idx}.sock"))
+    else:
+        paths = [args.socket]
+
+    stats = []
+    for path in paths:
+        try:
+            stat = query_status(path)
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            print(f"ERROR: Invalid data in response: {exc}", file=sys.stderr)
+            return 1
+        except FileNotFoundError as exc:
+            print(f"ERROR: Unable to connect to mgmt socket: {path}", file=sys.stderr)
             print("       Is taky running?", file=sys.stderr)
-        return 1
-    finally:
-        sock.close()
-        sock = None
+            return 1
+        except socket.error as exc:
+            print("ERROR: Socket error:", exc)
+            if exc.errno in [2, 111]:
+                print("       Is taky running?", file=sys.stderr)
+            return 1
+
+        if stat is None:
+            print("ERROR: No response from server", file=sys.stderr)
+            return 1
+        stats.append(stat)
+
+    stat = merge_status(stats)
+    if args.json:
+        print(json.dumps(stat))
+    else:
+        print_status(stat)
 
     return 0
@@ -1,4 +1,5 @@
 import os
+import sys
 import logging
 import configparser
 
@@ -20,6 +21,27 @@ DEFAULT_CFG = {
         "mon_port": None,
         "log_cot": None,  # Path to log COT files to
         "max_persist_ttl": -1,  # Enforce a maximum persistence TTL
+        "mode": "select",  # Server implementation: select, asyncio or uvloop
+        "workers": 1,  # Number of server processes
+        "tx_high_water": 4194304,  # Per client send queue limit (bytes)
+        "tx_low_water": 1048576,  # Send queue size where the limit is lifted
+        "slow_client_policy": "drop_oldest",  # Or drop_volatile, disconnect
+        "coalesce": False,  # Replace unsent atoms with newer ones for the UID
+        "rx_chunk": 65536,  # Size of each client's receive buffer
+        "rx_budget": 262144,  # Max bytes read from a client per loop
+        "max_event_size": 1048576,  # Largest event accepted from a client
+        "tx_budget": 262144,  # Max bytes sent to a client per loop
+        "suppress_duplicates": False,  # Don't relay unchanged re-broadcasts
+    },
+    "persistence": {
+        "write_behind": False,  # Write to Redis from a background thread
+        "queue_max": 100000,  # Max events waiting to be written
+        "cache_size": 0,  # Events cached in memory from Redis (0 is off)
+        "cache_ttl": 60,  # Max seconds to trust a cached event
+        "keyspace_events": False,  # Use Redis keyspace notifications
+        "sqlite": None,  # Path to a SQLite database, if Redis is not used
+        "binary": False,  # Store events as packed binary records
+        "kept_types": None,  # Comma separated event type prefixes to keep
     },
     "dp_server": {
         "upload_path": "/var/taky/dp-user",
@@ -81,6 +103,7 @@ def load_config(path=None, explicit=False):
         ("taky", "root_dir"),
         ("dp_server", "upload_path"),
         ("cot_server", "log_cot"),
+        ("persistence", "sqlite"),
     ]:
         path = ret_config.get(sect, opt)
         if path and not os.path.isabs(path):
@@ -110,6 +133,60 @@ def load_config(path=None, explicit=False):
             raise ValueError(f"Invalid max_persist_ttl: {max_ttl}") from exc
     ret_config.set("cot_server", "max_persist_ttl", str(max_ttl))
 
+    for opt in ["rx_chunk", "rx_budget", "tx_budget", "max_event_size"]:
+        val = ret_config.get("cot_server", opt)
+        try:
+            val = int(val)
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"Invalid {opt}: {val}") from exc
+        if val <= 0:
+            raise ValueError(f"Invalid {opt}: {val}")
+        ret_config.set("cot_server", opt, str(val))
+
+    for opt in ["tx_high_water", "tx_low_water"]:
+        val = ret_config.get("cot_server", opt)
+        try:
+            val = int(val)
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"Invalid {opt}: {val}") from exc
+        if val < 0:
+            raise ValueError(f"Invalid {opt}: {val}")
+        ret_config.set("cot_server", opt, str(val))
+
+    for opt in ["queue_max", "cache_size", "cache_ttl"]:
+        val = ret_config.get("persistence", opt)
+        try:
+            val = int(val)
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"Invalid {opt}: {val}") from exc
+        if val < 0:
+            raise ValueError(f"Invalid {opt}: {val}")
+        ret_config.set("persistence", opt, str(val))
+
+    policy = ret_config.get("cot_server", "slow_client_policy")
+    if policy not in ["drop_oldest", "drop_volatile", "disconnect"]:
+        raise ValueError(f"Invalid slow_client_policy: {policy}")
+
+    mode = ret_config.get("cot_server", "mode")
+    if mode in [None, ""]:
+        mode = "select"
+    if mode not in ["select", "asyncio", "uvloop"]:
+        raise ValueError(f"Invalid mode: {mode}")
+    if mode != "select" and sys.version_info < (3, 7):
+        raise ValueError(f"The {mode} mode requires Python 3.7 or later")
+    ret_config.set("cot_server", "mode", mode)
+
+    workers = ret_config.get("cot_server", "workers")
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"Invalid workers: {workers}") from exc
+    if workers < 1:
+        raise ValueError(f"Invalid workers: {workers}")
+    if workers > 1 and mode != "select":
+        raise ValueError("Multiple workers are only supported in select mode")
+    ret_config.set("cot_server", "workers", str(workers))
+
     if not ret_config.getboolean("ssl", "enabled"):
         # Disable monitor port
         ret_config.set("cot_server", "mon_ip", None)
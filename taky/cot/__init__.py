@@ -1,4 +1,5 @@
 from .models import *
 from .server import COTServer
+from .aioserver import AsyncCOTServer
 from .client import TAKClient, SocketTAKClient
 from .router import COTRouter
@@ -1,5 +1,7 @@
 # pylint: disable=missing-module-docstring
+import os
 import sys
+import socket
 import signal
 import logging
 import argparse
@@ -7,8 +9,10 @@ import configparser
 import pdb, bdb
 
 from taky import __version__
-from taky.cot import COTServer
+from taky.cot import COTServer, AsyncCOTServer
+from taky.cot.peer import Hub
 from taky.config import load_config
+from taky.config import app_config as config
 
 
 class SigHdlr:
@@ -80,21 +84,40 @@ def main():
             argp.error(f"Unable to load config file: '{args.cfg_file}'")
         else:
             argp.error("Unable to load './taky.conf' or '/etc/taky.conf'")
-    except configparser.ParsingError as exc:
+    except (configparser.ParsingError, ValueError) as exc:
         print(f"Configuration file error: {str(exc)}", file=sys.stderr)
         sys.exit(1)
 
     # TODO: Check for ipv6 support
     gst = SigHdlr(args.debug)
 
-    cot_srv = COTServer()
+    workers = config.getint("cot_server", "workers")
+    if workers > 1:
+        sys.exit(run_workers(gst, workers))
+
+    sys.exit(run_server(gst))
+
+
+def run_server(gst, worker=None, hub_sock=None):
+    """
+    Run a COT server until SIGTERM is received
+
+    @return The exit code
+    """
+    ret = 0
+
+    if config.get("cot_server", "mode") == "select":
+        cot_srv = COTServer(worker=worker, hub_sock=hub_sock)
+    else:
+        cot_srv = AsyncCOTServer()
+
     try:
         cot_srv.sock_setup()
     except Exception as exc:  # pylint: disable=broad-except
         logging.error("Unable to start COTServer: %s", exc)
         logging.debug("", exc_info=exc)
         cot_srv.shutdown()
-        sys.exit(1)
+        return 1
 
     try:
         while not gst.got_sigterm:
@@ -114,7 +137,65 @@ def main():
         logging.critical("Exception during shutdown", exc_info=exc)
         ret = 1
 
-    sys.exit(ret)
+    return ret
+
+
+def run_workers(gst, num_workers):
+    """
+    Fork worker processes which share the server port, and relay events
+    between them until SIGTERM is received, or a worker exits.
+
+    @return The exit code
+    """
+    ret = 0
+    hub = Hub()
+    pids = {}
+
+    for idx in range(num_workers):
+        (hub_sock, worker_sock) = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            hub_sock.close()
+            hub.detach()
+            os._exit(run_server(gst, worker=idx, hub_sock=worker_sock))
+
+        logging.info("Started worker %d (pid %d)", idx, pid)
+        worker_sock.close()
+        hub.add_worker(hub_sock)
+        pids[pid] = idx
+
+    try:
+        while not gst.got_sigterm:
+            if not hub.loop():
+                logging.error("Lost connection to a worker")
+                ret = 1
+                break
+
+            (pid, status) = os.waitpid(-1, os.WNOHANG)
+            if pid in pids:
+                logging.error("Worker %d exited (status %d)", pids.pop(pid), status)
+                ret = 1
+                break
+    except KeyboardInterrupt:
+        pass
+    except Exception as exc:  # pylint: disable=broad-except
+        logging.critical("Unhandled exception", exc_info=exc)
+        ret = 1
+
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    for (pid, idx) in pids.items():
+        (_, status) = os.waitpid(pid, 0)
+        if status != 0:
+            logging.warning("Worker %d exited (status %d)", idx, status)
+            ret = 1
+
+    hub.close()
+    return ret
 
 
 if __name__ == "__main__":
@@ -0,0 +1,289 @@
+"""
+An asyncio based alternative to the selector driven COTServer.
+
+The event loop owns the sockets, so TLS, buffering and flow control are
+handled by asyncio (or uvloop, if installed and configured) rather than by
+the SocketClient state machine. Parsing and routing still go through
+TAKClient.feed() and COTRouter.route().
+"""
+import os
+import time
+import asyncio
+import logging
+
+from lxml import etree
+
+from taky.config import app_config as config
+from taky.util import FramingError
+from .client import TAKClient
+from .server import BaseCOTServer
+from . import mgmt
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+def new_event_loop():
+    """
+    Build the event loop for the configured server mode
+    """
+    if config.get("cot_server", "mode") == "uvloop":
+        if uvloop is not None:
+            return uvloop.new_event_loop()
+
+        logging.warning("uvloop is not installed, using asyncio event loop")
+
+    return asyncio.new_event_loop()
+
+
+class AsyncTAKClient(TAKClient):
+    """
+    A TAK client attached to an asyncio stream
+    """
+
+    sends_wire = True
+
+    def __init__(self, reader, writer, **kwargs):
+        super().__init__(**kwargs)
+        self.reader = reader
+        self.writer = writer
+        self.peer_cert = writer.get_extra_info("peercert")
+        # Bytes handed to the writer, and the count at the end of the replay
+        self.tx_written = 0
+        self.replay_end = 0
+
+    def __repr__(self):
+        if self.user:
+            return (
+                f"<AsyncTAKClient uid={self.user.uid} "
+                f"callsign={self.user.callsign} "
+                f"addr={self.addr[0]}:{self.addr[1]}>"
+            )
+
+        return (
+            f"<AsyncTAKClient uid=None "
+            f"callsign=None "
+            f"addr={self.addr[0]}:{self.addr[1]}>"
+        )
+
+    @property
+    def addr(self):
+        addr = self.writer.get_extra_info("peername")
+        if not addr:
+            return (None, None)
+        return addr[0:2]
+
+    @property
+    def is_closed(self):
+        return self.writer.is_closing()
+
+    def send_event(self, event):
+        """
+        Send a CoT event to the client.
+
+        @param event A CoT Event object
+        """
+        if self.is_closed:
+            return
+
+        if not self.tx_admit(event):
+            return
+
+        self.writer.write(event.as_bytes)
+        self.tx_written += len(event.as_bytes)
+
+    def send_wire(self, data):
+        if self.is_closed:
+            return
+
+        self.writer.write(data)
+        self.tx_written += len(data)
+        self.replay_end = self.tx_written
+
+    @property
+    def tx_queued(self):
+        return self.writer.transport.get_write_buffer_size()
+
+    @property
+    def tx_replay_queued(self):
+        sent = self.tx_written - self.tx_queued
+        return max(0, self.replay_end - sent)
+
+    def disconnect(self, reason=None):
+        if not self.is_closed:
+            self.lgr.info("Socket disconnect: %s", reason)
+            self.writer.close()
+
+
+class AsyncCOTServer(BaseCOTServer):
+    """
+    AsyncCOTServer hosts the same sockets as COTServer, but serves them from
+    an asyncio event loop.
+
+    It is a drop in replacement for COTServer: call sock_setup(), then loop()
+    in a "while True" block. Each call to loop() runs the event loop for about
+    a second.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.aio = new_event_loop()
+
+        self.servers = []
+        self.rx_chunk = config.getint("cot_server", "rx_chunk")
+
+    def sock_setup(self):
+        """
+        Build the server sockets, and start serving them
+        """
+        self.started = time.time()
+        self.aio.run_until_complete(self._sock_setup())
+
+    async def _sock_setup(self):
+        # Setup the Management Socket
+        self.mgmt = self.listen_mgmt()
+        if self.mgmt:
+            srv = await asyncio.start_unix_server(self.handle_mgmt, sock=self.mgmt)
+            self.servers.append(srv)
+
+        # Setup the Server Socket
+        srv = await asyncio.start_server(
+            self.handle_cot, sock=self.listen_cot(), ssl=self.ssl_ctx
+        )
+        self.servers.append(srv)
+
+        # Setup the Monitor Socket
+        mon = self.listen_mon()
+        if mon:
+            srv = await asyncio.start_server(self.handle_mon, sock=mon)
+            self.servers.append(srv)
+
+    async def handle_mgmt(self, reader, writer):
+        """
+        Serve a client on the management socket
+        """
+        self.lgr.info("New management client")
+        try:
+            while True:
+                msg = await reader.readuntil(b"\0")
+                writer.write(mgmt.handle_cmd(self, msg[:-1]))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_mon(self, reader, writer):
+        """
+        Serve a client on the monitor socket
+        """
+        client = AsyncTAKClient(
+            reader,
+            writer,
+            monitor=True,
+            cbs={"route": self.router.route, "disconnect": self.client_disconnect},
+        )
+        (ip_addr, port) = client.addr
+        self.lgr.info("New tcp mon client from %s:%s", ip_addr, port)
+        await self.serve_client(client)
+
+    async def handle_cot(self, reader, writer):
+        """
+        Serve a client on the COT socket
+        """
+        client = AsyncTAKClient(
+            reader,
+            writer,
+            cbs={
+                "route": self.router.route,
+                "packet_rx": self.mon_packet,
+                "disconnect": self.client_disconnect,
+            },
+        )
+        (ip_addr, port) = client.addr
+        stype = "ssl" if self.ssl_ctx else "tcp"
+        self.lgr.info("New %s cot client from %s:%s", stype, ip_addr, port)
+        await self.serve_client(client)
+
+    async def serve_client(self, client):
+        """
+        Feed data from the client to the router until it disconnects
+        """
+        self.clients[client.writer] = client
+        self.router.client_connect(client)
+        self.client_connect(client)
+
+        reason = "Client disconnected"
+        try:
+            while not client.is_closed:
+                data = await client.reader.read(self.rx_chunk)
+                if len(data) == 0:
+                    break
+
+                client.feed(data)
+
+                # Don't read from a client faster than it accepts our replies
+                await client.writer.drain()
+        except etree.XMLSyntaxError as exc:
+            reason = "XML Syntax Error"
+            client.lgr.debug("XML Syntax Error: %s", client, exc_info=exc)
+        except FramingError as exc:
+            reason = f"Framing Error: {exc}"
+        except (ConnectionError, OSError) as exc:
+            reason = str(exc)
+        finally:
+            self.client_disconnect(client, reason)
+
+    def client_disconnect(self, client, reason=None):
+        """
+        Disconnect a client from the server
+        """
+        client.disconnect(reason)
+        client.close()
+        if self.clients.pop(client.writer, None) is not None:
+            self.router.client_disconnect(client)
+
+    def loop(self):
+        """
+        Main loop. Call outside this object in a "while True" block.
+        """
+        self.aio.run_until_complete(asyncio.sleep(1))
+
+        # Prune the persistence database
+        self.router.prune()
+
+    def shutdown(self):
+        """
+        Disconnect all clients, close server sockets.
+        """
+        self.lgr.info("Sending disconnect to clients")
+        for client in list(self.clients.values()):
+            self.client_disconnect(client, "Server shutting down")
+
+        for srv in self.servers:
+            srv.close()
+            self.aio.run_until_complete(srv.wait_closed())
+        self.servers = []
+
+        if self.mgmt:
+            try:
+                os.remove(self.mgmt_sock_path)
+            except FileNotFoundError:
+                pass
+
+            self.mgmt = None
+
+        # Let the client tasks finish up
+        self.aio.run_until_complete(self._cancel_tasks())
+        self.aio.close()
+        self.router.close()
+        self.lgr.info("Stopped")
+
+    @staticmethod
+    async def _cancel_tasks():
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -2,6 +2,8 @@
 import os
 import time
 import enum
+import itertools
+from collections import deque
 from datetime import datetime as dt
 from datetime import timedelta
 import socket
@@ -12,8 +14,16 @@ import traceback
 from lxml import etree
 
 from taky.config import app_config
-from taky.util import XMLDeclStrip
+from taky.util import EventFramer, FramingError
 from . import models
+from .persistence import kept_types_matcher
+
+# Maximum number of buffers passed to a single sendmsg() call
+TX_IOV_MAX = 64
+# Maximum payload of a TLS record
+SSL_RECORD_MAX = 16384
+# Tags the replay of persisted events, which never matches a UID
+REPLAY_TAG = object()
 
 
 class SSLState(enum.Enum):
@@ -27,17 +37,37 @@ class SSLState(enum.Enum):
 
 class SocketClient:
     """
-    A class to simplify tracking connection details for a select() based
+    A class to simplify tracking connection details for a selector based
     server, such as SSL handshake state, and an outgoing data buffer.
     """
 
     def __init__(self, sock, use_ssl=False, **kwargs):
         self.sock = sock
+        # Keep the descriptor, so the server can unregister a closed socket
+        self.sock_fd = sock.fileno()
         self.ssl = use_ssl
         self.peer_cert = None
         self.ssl_hs = SSLState.SSL_WAIT if use_ssl else SSLState.NO_SSL
-        self.out_buff = b""
+        # Outgoing data is a queue of [chunk, tag] entries. out_off is how
+        # much of the first chunk has already been sent, and out_len is the
+        # total left to send.
+        self.out_queue = deque()
+        self.out_off = 0
+        self.out_len = 0
+        # The size of an SSL write which would have blocked. It must be
+        # retried with the same bytes, so the entries it covers are locked.
+        self.ssl_pending = 0
+        # The newest queued entry for each tag
+        self.out_tags = {}
+
+        # Receive into one buffer for the life of the client. Each readiness
+        # event may read or write up to the budget before yielding.
+        self.rx_buff = bytearray(app_config.getint("cot_server", "rx_chunk"))
+        self.rx_view = memoryview(self.rx_buff)
+        self.rx_budget = app_config.getint("cot_server", "rx_budget")
+        self.tx_budget = app_config.getint("cot_server", "tx_budget")
         self.connect_cb = kwargs.get("cbs", {}).get("connect", lambda client: None)
+        self.tx_cb = kwargs.get("cbs", {}).get("tx", lambda client: None)
 
         (ip, port) = self.addr
         lgr_name = f"{self.__class__.__name__}@{ip}:{port}"
@@ -73,7 +103,7 @@ class SocketClient:
         """
         Returns true if the socket wants to be considered for transmitting
         """
-        return len(self.out_buff) > 0 or self.ssl_hs == SSLState.SSL_WAIT_TX
+        return self.out_len > 0 or self.ssl_hs == SSLState.SSL_WAIT_TX
 
     def __repr__(self):
         (ip, port) = self.addr[0:2]
@@ -85,6 +115,132 @@ class SocketClient:
         """
         raise NotImplementedError()
 
+    def send_data(self, data, tag=None, replace=False):
+        """
+        Queue data to be transmitted to the client
+
+        @param data    The bytes to send
+        @param tag     An optional key for the data, used by tx_drop()
+        @param replace If data with the same tag is still waiting to be sent,
+                       overwrite it in place instead of queueing more
+
+        @return True if queued data was replaced
+        """
+        if not data:
+            return False
+
+        if replace and tag is not None:
+            entry = self.out_tags.get(tag)
+            locked = itertools.islice(self.out_queue, self.tx_locked())
+            if entry is not None and all(entry is not item for item in locked):
+                self.out_len += len(data) - len(entry[0])
+                entry[0] = data
+                return True
+
+        was_empty = self.out_len == 0
+        entry = [data, tag]
+        self.out_queue.append(entry)
+        self.out_len += len(data)
+        if tag is not None:
+            self.out_tags[tag] = entry
+        if was_empty:
+            self.tx_cb(self)
+
+        return False
+
+    def _untag(self, entry):
+        if entry[1] is not None and self.out_tags.get(entry[1]) is entry:
+            del self.out_tags[entry[1]]
+
+    def tx_locked(self):
+        """
+        Returns the number of entries at the head of the queue which must not
+        be changed: one partly sent, and those in a pending SSL write.
+        """
+        locked = self.out_off + self.ssl_pending
+        count = 0
+        for (chunk, _) in self.out_queue:
+            if locked <= 0:
+                break
+            locked -= len(chunk)
+            count += 1
+
+        return count
+
+    def tx_drop(self, tag):
+        """
+        Remove queued data with the given tag, unless it has started to be
+        transmitted.
+
+        @return The number of chunks dropped
+        """
+        locked = self.tx_locked()
+        keep = deque()
+        dropped = 0
+        for (idx, entry) in enumerate(self.out_queue):
+            if entry[1] == tag and idx >= locked:
+                self.out_len -= len(entry[0])
+                self._untag(entry)
+                dropped += 1
+            else:
+                keep.append(entry)
+
+        if dropped:
+            self.out_queue = keep
+
+        return dropped
+
+    def tx_buffers(self):
+        """
+        Returns a list of buffers for the next transmission, without copying
+        the queued data.
+        """
+        bufs = []
+        for (chunk, _) in self.out_queue:
+            if not bufs:
+                chunk = memoryview(chunk)[self.out_off :]
+            bufs.append(chunk)
+            if len(bufs) >= TX_IOV_MAX:
+                break
+
+        return bufs
+
+    def tx_ssl_buffer(self):
+        """
+        Returns the next buffer to transmit over SSL, which can't send more
+        than one buffer per call. Small chunks are joined, up to the size of
+        one TLS record. A write which would have blocked is rebuilt as it was.
+        """
+        limit = self.ssl_pending or SSL_RECORD_MAX
+        head = memoryview(self.out_queue[0][0])[self.out_off :]
+        if len(head) >= limit or len(self.out_queue) == 1:
+            return head[:limit]
+
+        bufs = [head]
+        size = len(head)
+        for (chunk, _) in itertools.islice(self.out_queue, 1, None):
+            if size + len(chunk) > limit:
+                break
+            bufs.append(chunk)
+            size += len(chunk)
+
+        return b"".join(bufs)
+
+    def tx_consume(self, sent):
+        """
+        Drop sent bytes from the outgoing queue
+        """
+        self.out_len -= sent
+        while sent > 0:
+            remain = len(self.out_queue[0][0]) - self.out_off
+            if sent < remain:
+                self.out_off += sent
+                return
+
+            sent -= remain
+            self._untag(self.out_queue.popleft())
+            self.out_off = 0
+
     def ssl_handshake(self):
         """Preform the SSL handshake on the socket"""
         if self.ready:
@@ -107,32 +263,56 @@ class SocketClient:
         Call this whenever a socket indicates it has data to receive.
 
         If the socket is SSL based, this may be part of the handshake.
+
+        Data is read until the socket would block, or rx_budget bytes have
+        been read.
+
+        @return True if the budget ran out before the socket was drained
         """
         if self.ssl and not self.ready:
             self.ssl_handshake()
-            return
+            return False
 
+        budget = self.rx_budget
         try:
-            data = self.sock.recv(4096)
+            while budget > 0:
+                nbytes = self.sock.recv_into(self.rx_buff)
 
-            if len(data) == 0:
-                self.disconnect("Client disconnected")
-                return
+                if nbytes == 0:
+                    self.disconnect("Client disconnected")
+                    return False
 
-            self.feed(data)
+                self.feed(self.rx_view[:nbytes])
+                budget -= nbytes
+
+                # A short read means the kernel buffer is empty. An SSL read
+                # returns at most one record, so keep reading until it would
+                # block.
+                if nbytes < len(self.rx_buff) and not self.ssl:
+                    return False
         except etree.XMLSyntaxError as exc:
             self.disconnect("XML Syntax Error")
             self.lgr.debug("XML Syntax Error: %s", self, exc_info=exc)
-        except BlockingIOError:
-            self.lgr.debug("Client blocked RX: %s", self)
+            return False
+        except FramingError as exc:
+            self.disconnect(f"Framing Error: {exc}")
+            return False
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return False
         except (ssl.SSLError, socket.error, IOError, OSError) as exc:
             self.disconnect(str(exc))
+            return False
+
+        return True
 
     def socket_tx(self):
         """
         Transmit data to client socket. (Check has_data to see if this needs
         to be called.)
 
+        Data is sent until the socket would block, the queue is empty, or
+        tx_budget bytes have been sent.
+
         If the client is SSL enabled, and the handshake has not yet taken
         place, we fail silently.
         """
@@ -140,10 +320,27 @@ class SocketClient:
             self.ssl_handshake()
             return
 
+        budget = self.tx_budget
         try:
-            sent = self.sock.send(self.out_buff[0:4096])
-            self.out_buff = self.out_buff[sent:]
-        except BlockingIOError:
+            while budget > 0 and self.out_len > 0:
+                if self.ssl:
+                    buff = self.tx_ssl_buffer()
+                    want = len(buff)
+                    self.ssl_pending = want
+                    sent = self.sock.send(buff)
+                    self.ssl_pending = 0
+                else:
+                    bufs = self.tx_buffers()
+                    want = sum(len(buf) for buf in bufs)
+                    sent = self.sock.sendmsg(bufs)
+
+                self.tx_consume(sent)
+                budget -= sent
+
+                # The socket buffer is full
+                if sent < want:
+                    return
+        except (BlockingIOError, ssl.SSLWantWriteError, ssl.SSLWantReadError):
             self.lgr.debug("Client blocked TX: %s", self)
         except (ssl.SSLError, socket.error, IOError, OSError) as exc:
             self.disconnect(str(exc))
@@ -168,8 +365,13 @@ class TAKClient:
     the client.
     """
 
+    # True if the client implements send_wire()
+    sends_wire = False
+
     def __init__(self, monitor=False, **kwargs):
         self.monitor = monitor
+        # True if this is a link to another taky worker
+        self.peer = False
         self.user = None
         self.connected = time.time()
         self.num_rx = 0
@@ -179,13 +381,25 @@ class TAKClient:
         self.route = cbs.get("route", lambda client, pkt: None)
         self.packet_rx = cbs.get("packet_rx", lambda pkt: None)
         self.client_ident = cbs.get("client_ident", lambda pkt: None)
+        # The server must stop tracking a client it disconnects
+        self.disconnect_cb = cbs.get(
+            "disconnect", lambda client, reason: client.disconnect(reason)
+        )
 
         self.log_cot_dir = app_config.get("cot_server", "log_cot")
         self.cot_fp = None
 
-        parser = etree.XMLPullParser(tag="event", resolve_entities=False)
-        parser.feed(b"<root>")
-        self.xdc = XMLDeclStrip(parser)
+        self.tx_high_water = app_config.getint("cot_server", "tx_high_water")
+        self.tx_low_water = app_config.getint("cot_server", "tx_low_water")
+        self.tx_policy = app_config.get("cot_server", "slow_client_policy")
+        self.kept_types = kept_types_matcher()
+        self.tx_congested = False
+        self.tx_dropped = 0
+        self.tx_coalesce = app_config.getboolean("cot_server", "coalesce")
+        self.tx_coalesced = 0
+
+        self.framer = EventFramer(app_config.getint("cot_server", "max_event_size"))
+        self.parser = etree.XMLParser(resolve_entities=False)
 
         self.lgr = logging.getLogger(self.__class__.__name__)
 
@@ -203,6 +417,83 @@ class TAKClient:
         """
         raise NotImplementedError()
 
+    def send_wire(self, data):
+        """
+        Send pre-serialized CoT events to the client.
+
+        @param data The XML of one or more events
+        """
+        raise NotImplementedError()
+
+    @property
+    def tx_queued(self):
+        """
+        The number of bytes waiting to be sent to the client
+        """
+        return 0
+
+    @property
+    def tx_replay_queued(self):
+        """
+        The number of queued bytes from the replay of persisted events, which
+        are not held against the slow client policy
+        """
+        return 0
+
+    def tx_drop_superseded(self, uid):  # pylint: disable=unused-argument
+        """
+        Drop queued events for the UID. Returns the number of events dropped.
+        """
+        return 0
+
+    def tx_admit(self, event):
+        """
+        Apply the slow client policy before queueing an event.
+
+        Once the send queue grows past tx_high_water, the policy is applied to
+        every event until the queue drains below tx_low_water.
+
+        @return False if the event should not be sent
+        """
+        if self.tx_high_water <= 0:
+            return True
+
+        queued = self.tx_queued - self.tx_replay_queued
+        if self.tx_congested:
+            if queued <= self.tx_low_water:
+                self.lgr.info("Send queue drained (%d bytes)", queued)
+                self.tx_congested = False
+                return True
+        elif queued >= self.tx_high_water:
+            self.lgr.warning(
+                "Send queue full (%d bytes), applying %s policy",
+                queued,
+                self.tx_policy,
+            )
+            self.tx_congested = True
+        else:
+            return True
+
+        if self.tx_policy == "disconnect":
+            self.disconnect_cb(self, "Send queue full")
+            return False
+
+        if self.tx_policy == "drop_volatile":
+            if self.kept_types.match(event.etype):
+                return True
+            self.tx_dropped += 1
+            return False
+
+        # drop_oldest: Only the newest event for a UID is worth sending
+        self.tx_dropped += self.tx_drop_superseded(event.uid)
+        return True
+
+    def disconnect(self, reason=None):
+        """
+        Close the connection to the client. Implemented in a subclass.
+        """
+        raise NotImplementedError()
+
     def close(self):
         self.close_cot()
 
@@ -279,14 +570,21 @@ class TAKClient:
         """
         Feed the XML data parser with COT data
         """
-        # TODO: Specify maximum element size
-        self.xdc.feed(data)
+        self.framer.feed(data)
+
+        for frame in self.framer.read_frames():
+            elm = etree.fromstring(frame, self.parser)
+            # Only <event> documents are CoT
+            if elm.tag != "event":
+                continue
 
-        for (_, elm) in self.xdc.read_events():
             self.num_rx += 1
             self.last_rx = time.time()
             try:
-                evt = models.Event.from_elm(elm)
+                # Keep the received XML, so unmodified events are forwarded
+                # without being rebuilt from the model. Fields are decoded
+                # as the router needs them.
+                evt = models.LazyEvent.from_elm(elm, wire=frame)
                 self.packet_rx(evt)
 
                 if not evt.etype:
@@ -313,8 +611,6 @@ class TAKClient:
                 self.lgr.error(etree.tostring(elm, pretty_print=True))
                 self.log_event(elm=elm, _exc=traceback.format_exc())
                 continue
-            finally:
-                elm.clear(keep_tail=True)
 
     def handle_atom(self, evt):
         """
@@ -360,6 +656,8 @@ class SocketTAKClient(TAKClient, SocketClient):
     A TAK client based on sockets
     """
 
+    sends_wire = True
+
     def __init__(self, **kwargs):
         TAKClient.__init__(self, **kwargs)
         SocketClient.__init__(self, **kwargs)
@@ -391,4 +689,36 @@ class SocketTAKClient(TAKClient, SocketClient):
         if not self.ready:
             return
 
-        self.out_buff += etree.tostring(event.as_element)
+        if not self.tx_admit(event):
+            return
+
+        # Only the latest position of an atom matters to a client that is
+        # behind, so it can replace an update which has not been sent yet
+        coalesce = self.tx_coalesce and event.etype.startswith("a")
+        if self.send_data(event.as_bytes, event.uid, replace=coalesce):
+            self.tx_coalesced += 1
+
+    def send_wire(self, data):
+        if not self.ready:
+            return
+
+        self.send_data(data, REPLAY_TAG)
+
+    def disconnect(self, reason=None):
+        SocketClient.disconnect(self, reason)
+
+    @property
+    def tx_queued(self):
+        return self.out_len
+
+    @property
+    def tx_replay_queued(self):
+        entry = self.out_tags.get(REPLAY_TAG)
+        if entry is None:
+            return 0
+        if self.out_queue[0] is entry:
+            return len(entry[0]) - self.out_off
+        return len(entry[0])
+
+    def tx_drop_superseded(self, uid):
+        return self.tx_drop(uid)
@@ -1,5 +1,6 @@
 from .errors import UnmarshalError
 from .event import Event
+from .lazyevent import LazyEvent
 from .point import Point
 from .detail import Detail
 from .geochat import GeoChat
@@ -10,6 +11,7 @@ from .takuser import TAKDevice
 __all__ = [
     "UnmarshalError",
     "Event",
+    "LazyEvent",
     "Point",
     "Detail",
     "GeoChat",
@@ -1,13 +1,55 @@
 from .errors import UnmarshalError
 
 
+class DetailScan:  # pylint: disable=too-few-public-methods
+    """
+    The children of a <detail> element, collected in a single pass.
+
+    children maps each tag to the last child with that tag, so a repeated
+    element overrides the earlier ones, and marti_cs holds the callsigns of
+    the <dest> elements in the first <marti>.
+    """
+
+    __slots__ = ("elm", "children", "marti_cs")
+
+    def __init__(self, elm):
+        self.elm = elm
+        self.children = {}
+        self.marti_cs = ()
+
+        for child in elm.iterchildren():
+            if child.tag == "marti" and "marti" not in self.children:
+                self.marti_cs = tuple(
+                    dest.get("callsign") for dest in child.iterchildren("dest")
+                )
+
+            self.children[child.tag] = child
+
+
 class Detail:
     """
     A simple class to keep track of the Detail element
     """
 
-    def __init__(self, elm):
+    __slots__ = ("elm", "_scan")
+
+    def __init__(self, elm, scan=None):
         self.elm = elm
+        self._scan = scan
+
+    @property
+    def scan(self):
+        """
+        The DetailScan of the element, built on first use. It is rebuilt if
+        the element is replaced.
+        """
+        if self.elm is None:
+            return None
+
+        if self._scan is None or self._scan.elm is not self.elm:
+            self._scan = DetailScan(self.elm)
+
+        return self._scan
 
     def __repr__(self):
         "<GenericDetail>"
@@ -22,31 +64,19 @@ class Detail:
 
     @property
     def has_marti(self):
-        if self.elm is None:
-            return False
-
-        marti = self.elm.find("marti")
-        if marti is None:
-            return False
-
-        return len(list(self.marti_cs)) > 0
+        return len(self.marti_cs) > 0
 
     @property
     def marti_cs(self):
         """
-        A list of callsigns in the Marti tag (if present)
+        A tuple of callsigns in the Marti tag (if present)
 
-        Returns an empty list if not present
+        Returns an empty tuple if not present
         """
         if self.elm is None:
-            return
-
-        marti = self.elm.find("marti")
-        if marti is None:
-            return
+            return ()
 
-        for dest in marti.iterfind("dest"):
-            yield dest.get("callsign")
+        return self.scan.marti_cs
 
     @property
     def as_element(self):
@@ -60,11 +90,14 @@ class Detail:
         return self.elm
 
     @staticmethod
-    def from_elm(elm):
+    def from_elm(elm, scan=None):
         """
         Build a Detail object from an element, with the event for context
+
+        @param elm  The <detail> element
+        @param scan The DetailScan of elm, if already built
         """
         if elm.tag != "detail":
             raise UnmarshalError("Cannot create Detail from %s" % elm.tag)
 
-        return Detail(elm)
+        return Detail(elm, scan)
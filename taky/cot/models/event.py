@@ -1,16 +1,59 @@
 from datetime import datetime as dt
 
 from lxml import etree
-from dateutil.parser import isoparse
+
+from taky.util.cottime import parse_cot_time, format_cot_time
 
 from .errors import UnmarshalError
 from .point import Point
-from .detail import Detail
+from .detail import Detail, DetailScan
 from .geochat import GeoChat
 from .takuser import TAKUser
 
 
+def _timestamp(name):
+    """
+    Build a property for one of the event's timestamps. Assigning to it drops
+    the cached serialized form of the event.
+    """
+    attr = f"_{name}"
+
+    def fget(self):
+        return getattr(self, attr)
+
+    def fset(self, value):
+        setattr(self, attr, value)
+        self._wire = None  # pylint: disable=protected-access
+
+    return property(fget, fset)
+
+
 class Event:
+    """
+    A CoT Event.
+
+    The serialized form of the event is cached by as_bytes, so an event that
+    is routed to many clients is only built once. Assigning to time, start or
+    stale drops the cache, as the router changes those. Call invalidate()
+    after changing anything else.
+
+    Events are slotted, as the persistence store may hold one per tracked
+    uid.
+    """
+
+    __slots__ = (
+        "version",
+        "uid",
+        "etype",
+        "how",
+        "_time",
+        "_start",
+        "_stale",
+        "point",
+        "detail",
+        "_wire",
+    )
+
     def __init__(
         self,
         uid=None,
@@ -21,6 +64,7 @@ class Event:
         stale=None,
         version="2.0",
     ):
+        self._wire = None
         self.version = version
         self.uid = uid
         self.etype = etype
@@ -32,6 +76,16 @@ class Event:
         self.point = Point()
         self.detail = None
 
+    time = _timestamp("time")
+    start = _timestamp("start")
+    stale = _timestamp("stale")
+
+    def invalidate(self):
+        """
+        Drop the cached serialized form of the event
+        """
+        self._wire = None
+
     def __repr__(self):
         return '<Event uid="%s" etype="%s" time="%s">' % (
             self.uid,
@@ -44,14 +98,21 @@ class Event:
         return round((self.stale - dt.utcnow()).total_seconds())
 
     @staticmethod
-    def from_elm(elm):
+    def from_elm(elm, wire=None):
+        """
+        Build an Event from an element.
+
+        @param elm  The <event> element
+        @param wire The serialized form of elm, if already known. It will be
+                    used as-is for as_bytes, until the event is changed.
+        """
         if elm.tag != "event":
             raise UnmarshalError("Cannot create Event from %s" % elm.tag)
 
         try:
-            time = isoparse(elm.get("time")).replace(tzinfo=None)
-            start = isoparse(elm.get("start")).replace(tzinfo=None)
-            stale = isoparse(elm.get("stale")).replace(tzinfo=None)
+            time = parse_cot_time(elm.get("time"))
+            start = parse_cot_time(elm.get("start"))
+            stale = parse_cot_time(elm.get("stale"))
         except (TypeError, ValueError) as exc:
             raise UnmarshalError("Date parsing error") from exc
 
@@ -76,21 +137,34 @@ class Event:
                 if child.tag == "point":
                     ret.point = Point.from_elm(child)
                 elif child.tag == "detail":
-                    d_tags = set([d_elm.tag for d_elm in child.iterchildren()])
-                    if TAKUser.is_type(d_tags):
-                        ret.detail = TAKUser.from_elm(child, uid=ret.uid)
-                    elif GeoChat.is_type(d_tags):
-                        ret.detail = GeoChat.from_elm(child)
-                    else:
-                        ret.detail = Detail.from_elm(child)
+                    ret.detail = Event.detail_from_elm(child, ret.uid)
         except (TypeError, ValueError, AttributeError) as exc:
             if child is not None:
                 raise UnmarshalError(f"Issue parsing {child.tag}") from exc
             else:
                 raise UnmarshalError("Issue parsing children") from exc
 
+        ret._wire = wire  # pylint: disable=protected-access
         return ret
 
+    @staticmethod
+    def detail_from_elm(elm, uid):
+        """
+        Build the Detail object (or subclass) for a <detail> element
+
+        @param elm The <detail> element
+        @param uid The UID of the event the detail belongs to
+        """
+        # One pass over the children, shared by the type checks, the
+        # detail, and the router's Marti checks
+        scan = DetailScan(elm)
+        if TAKUser.is_type(scan.children):
+            return TAKUser.from_elm(elm, uid=uid, scan=scan)
+        if GeoChat.is_type(scan.children):
+            return GeoChat.from_elm(elm, scan=scan)
+
+        return Detail.from_elm(elm, scan=scan)
+
     @property
     def as_element(self):
         ret = etree.Element("event")
@@ -98,11 +172,21 @@ class Event:
         ret.set("uid", self.uid)
         ret.set("type", self.etype)
         ret.set("how", self.how)
-        ret.set("time", self.time.isoformat(timespec="milliseconds") + "Z")
-        ret.set("start", self.start.isoformat(timespec="milliseconds") + "Z")
-        ret.set("stale", self.stale.isoformat(timespec="milliseconds") + "Z")
+        ret.set("time", format_cot_time(self.time))
+        ret.set("start", format_cot_time(self.start))
+        ret.set("stale", format_cot_time(self.stale))
         ret.append(self.point.as_element)
         if self.detail is not None:
             ret.append(self.detail.as_element)
 
         return ret
+
+    @property
+    def as_bytes(self):
+        """
+        Returns the serialized XML of the event, as sent over the wire
+        """
+        if self._wire is None:
+            self._wire = etree.tostring(self.as_element)
+
+        return self._wire
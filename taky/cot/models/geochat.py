@@ -1,7 +1,8 @@
 import enum
 
 from lxml import etree
-from dateutil.parser import isoparse
+
+from taky.util.cottime import parse_cot_time, format_cot_time
 
 from .errors import UnmarshalError
 from .detail import Detail
@@ -25,8 +26,21 @@ class GeoChat(Detail):
     attempts to unify the field names and meanings.
     """
 
-    def __init__(self, elm):
-        super().__init__(elm)
+    __slots__ = (
+        "chatroom",
+        "chat_parent",
+        "group_owner",
+        "src_uid",
+        "src_cs",
+        "src_marker",
+        "message",
+        "message_ts",
+        "dst_uid",
+        "dst_team",
+    )
+
+    def __init__(self, elm, scan=None):
+        super().__init__(elm, scan)
 
         self.chatroom = None  # detail/__chat.chatroom
         self.chat_parent = None  # detail/__chat.parent
@@ -76,21 +90,23 @@ class GeoChat(Detail):
         return GEOCHAT_TAGS.issubset(tags)
 
     @staticmethod
-    def from_elm(elm):
+    def from_elm(elm, scan=None):
         if elm.tag != "detail":
             raise UnmarshalError("Cannot create GeoChat from %s" % elm.tag)
 
-        chat = elm.find("__chat")
+        gch = GeoChat(elm, scan)
+        children = gch.scan.children
+
+        chat = children.get("__chat")
         chatgrp = None
         if chat is not None:
             chatgrp = chat.find("chatgrp")
-        remarks = elm.find("remarks")
-        link = elm.find("link")
+        remarks = children.get("remarks")
+        link = children.get("link")
 
         if None in [chat, chatgrp, remarks, link]:
             raise UnmarshalError("Detail does not contain GeoChat")
 
-        gch = GeoChat(elm)
         gch.chat_parent = chat.get("parent")
         gch.group_owner = chat.get("groupOwner") == "true"
         gch.src_uid = link.get("uid")
@@ -105,7 +121,7 @@ class GeoChat(Detail):
             gch.dst_uid = chat.get("id")
 
         gch.message = remarks.text
-        gch.message_ts = isoparse(remarks.get("time")).replace(tzinfo=None)
+        gch.message_ts = parse_cot_time(remarks.get("time"))
 
         return gch
 
@@ -152,7 +168,7 @@ class GeoChat(Detail):
             attrib={
                 "source": rmk_src,
                 "to": dst_uid,
-                "time": self.message_ts.isoformat(timespec="milliseconds") + "Z",
+                "time": format_cot_time(self.message_ts),
             },
         )
         remarks.text = self.message
@@ -0,0 +1,172 @@
+from lxml import etree
+
+from taky.util.cottime import parse_cot_time
+
+from .errors import UnmarshalError
+from .event import Event
+from .point import Point
+
+_UNSET = object()
+
+
+def _lazy_field(name, decode):
+    """
+    Build a property which decodes a field on first access, using
+    decode(event). Assigning to the field stores the value as-is, and drops
+    the cached serialized form of the event.
+    """
+
+    def fget(self):
+        val = self._fields.get(name, _UNSET)
+        if val is _UNSET:
+            val = decode(self)
+            self._fields[name] = val
+        return val
+
+    def fset(self, value):
+        self._fields[name] = value
+        self._wire = None
+
+    return property(fget, fset)
+
+
+def _decode_time(attr):
+    def decode(self):
+        try:
+            return parse_cot_time(self._times[attr])
+        except (TypeError, ValueError) as exc:
+            raise UnmarshalError("Date parsing error") from exc
+
+    return decode
+
+
+def _child(self, tag):
+    """
+    Returns the <point> or <detail> element of the event, parsing the stored
+    bytes of a compacted event on first use.
+    """
+    if self._elms is None:
+        parser = etree.XMLParser(resolve_entities=False)
+        elm = etree.fromstring(self._src, parser)
+        self._elms = {"point": elm.find("point"), "detail": elm.find("detail")}
+        self._src = None
+
+    return self._elms.get(tag)
+
+
+def _decode_point(self):
+    elm = _child(self, "point")
+    if elm is None:
+        return Point()
+
+    try:
+        ret = Point.from_elm(elm)
+    except (TypeError, ValueError) as exc:
+        raise UnmarshalError("Issue parsing point") from exc
+
+    del self._elms["point"]
+    return ret
+
+
+def _decode_detail(self):
+    elm = _child(self, "detail")
+    if elm is None:
+        return None
+
+    try:
+        ret = Event.detail_from_elm(elm, self.uid)
+    except (TypeError, ValueError, AttributeError) as exc:
+        raise UnmarshalError("Issue parsing detail") from exc
+
+    del self._elms["detail"]
+    return ret
+
+
+class LazyEvent(Event):
+    """
+    A CoT Event, which only decodes its detail when it is first used.
+
+    from_elm() checks the uid and type, and decodes the timestamps and point,
+    which routing and persistence rely on, so an invalid event is rejected
+    the same way whichever store keeps it. The <detail> element is kept until
+    it is decoded, and an invalid detail raises UnmarshalError when it is
+    first accessed.
+
+    compact() builds a LazyEvent which only holds the serialized event, for
+    long lived copies such as the ones kept by the persistence store.
+    """
+
+    __slots__ = ("_fields", "_times", "_elms", "_src")
+
+    time = _lazy_field("time", _decode_time("time"))
+    start = _lazy_field("start", _decode_time("start"))
+    stale = _lazy_field("stale", _decode_time("stale"))
+    point = _lazy_field("point", _decode_point)
+    detail = _lazy_field("detail", _decode_detail)
+
+    def __init__(self, elm):  # pylint: disable=super-init-not-called
+        # Event.__init__() would overwrite the lazy fields
+        self._fields = {}
+        self._wire = None
+        self.version = elm.get("version")
+        self.uid = elm.get("uid")
+        self.etype = elm.get("type")
+        self.how = elm.get("how")
+        self._times = {
+            "time": elm.get("time"),
+            "start": elm.get("start"),
+            "stale": elm.get("stale"),
+        }
+        # Released once decoded
+        self._elms = {"point": elm.find("point"), "detail": elm.find("detail")}
+        self._src = None
+
+    @staticmethod
+    def from_elm(elm, wire=None):
+        """
+        Build a LazyEvent from an element.
+
+        @param elm  The <event> element
+        @param wire The serialized form of elm, if already known. It will be
+                    used as-is for as_bytes, until the event is changed.
+        """
+        if elm.tag != "event":
+            raise UnmarshalError("Cannot create Event from %s" % elm.tag)
+
+        ret = LazyEvent(elm)
+
+        if ret.uid is None:
+            raise UnmarshalError("Event must have 'uid' attribute")
+        if ret.etype is None:
+            raise UnmarshalError("Event must have 'type' attribute")
+
+        for name in ("time", "start", "stale", "point"):
+            getattr(ret, name)
+
+        ret._wire = wire  # pylint: disable=protected-access
+        return ret
+
+    @staticmethod
+    def compact(event):
+        """
+        Build a copy of an event, which keeps the serialized XML and the
+        timestamps, but not the point or detail (or the lxml tree behind
+        them). They are parsed from the XML again if they are used.
+
+        @param event The Event to copy
+        """
+        ret = LazyEvent.__new__(LazyEvent)
+        ret._fields = {  # pylint: disable=protected-access
+            "time": event.time,
+            "start": event.start,
+            "stale": event.stale,
+        }
+        ret.version = event.version
+        ret.uid = event.uid
+        ret.etype = event.etype
+        ret.how = event.how
+        ret._times = None  # pylint: disable=protected-access
+        ret._elms = None  # pylint: disable=protected-access
+        ret._src = event.as_bytes  # pylint: disable=protected-access
+        ret._wire = ret._src  # pylint: disable=protected-access
+        return ret
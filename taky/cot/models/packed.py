@@ -0,0 +1,194 @@
+"""
+A compact binary record for persisted events.
+
+The fixed fields of the event are packed into a header, followed by the
+length prefixed strings, and the <detail> element compressed with zlib:
+
+  magic      2s  b"TK"
+  format     B   PACK_VERSION
+  xml_len    I   Size of the event as XML
+  time       q   Milliseconds since the epoch
+  start      q
+  stale      q
+  point      5d  lat, lon, hae, ce, le
+  version, uid, type, how   H + UTF-8 bytes
+  detail     zlib compressed XML, or empty
+
+The header can be read without decoding the rest of the record, which lets
+a persistence store check stale times cheaply. Records start with the
+magic, so they can be told apart from XML (which starts with "<").
+
+Only the fields of the Event model are packed. Other attributes of the
+<event> (such as access or qos), and children other than <point> and
+<detail>, are dropped, so an unpacked event may not match the XML that was
+received.
+"""
+import struct
+import zlib
+from datetime import datetime as dt, timedelta
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+from taky.util.cottime import format_cot_time
+from .errors import UnmarshalError
+from .event import Event
+from .point import Point
+
+MAGIC = b"TK"
+PACK_VERSION = 1
+HEADER = struct.Struct("!2sBIqqq5d")
+STR_LEN = struct.Struct("!H")
+
+EPOCH = dt(1970, 1, 1)
+MSEC = timedelta(milliseconds=1)
+
+ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+
+def is_packed(data):
+    """
+    Returns True if data is a packed record, rather than XML
+    """
+    return data[: len(MAGIC)] == MAGIC
+
+
+def _to_ms(timestamp):
+    return (timestamp - EPOCH) // MSEC
+
+
+def _from_ms(msec):
+    return EPOCH + msec * MSEC
+
+
+def pack_event(event):
+    """
+    Encode an Event as a packed record
+    """
+    detail = b""
+    if event.detail is not None and event.detail.as_element is not None:
+        detail = zlib.compress(etree.tostring(event.detail.as_element, with_tail=False))
+
+    point = event.point
+    ret = [
+        HEADER.pack(
+            MAGIC,
+            PACK_VERSION,
+            len(event.as_bytes),
+            _to_ms(event.time),
+            _to_ms(event.start),
+            _to_ms(event.stale),
+            point.lat,
+            point.lon,
+            point.hae,
+            point.ce,
+            point.le,
+        )
+    ]
+
+    for val in [event.version, event.uid, event.etype, event.how]:
+        val = (val or "").encode()
+        ret.append(STR_LEN.pack(len(val)))
+        ret.append(val)
+
+    ret.append(detail)
+    return b"".join(ret)
+
+
+def _unpack(data):
+    """
+    Split a record into its header fields, strings, and compressed detail
+    """
+    try:
+        header = HEADER.unpack_from(data)
+        if header[0] != MAGIC or header[1] != PACK_VERSION:
+            raise UnmarshalError("Not a packed event record")
+
+        pos = HEADER.size
+        strs = []
+        for _ in range(4):
+            (length,) = STR_LEN.unpack_from(data, pos)
+            pos += STR_LEN.size
+            strs.append(data[pos : pos + length].decode())
+            pos += length
+    except (struct.error, UnicodeDecodeError) as exc:
+        raise UnmarshalError("Truncated packed event record") from exc
+
+    return (header, strs, data[pos:])
+
+
+def _detail_xml(detail):
+    if not detail:
+        return b""
+
+    try:
+        return zlib.decompress(detail)
+    except zlib.error as exc:
+        raise UnmarshalError("Corrupt detail in packed event record") from exc
+
+
+def packed_stale(data):
+    """
+    Return the stale time of a packed record, without decoding all of it
+    """
+    return _from_ms(HEADER.unpack_from(data)[5])
+
+
+def packed_xml_size(data):
+    """
+    Return the size of the event as XML, without decoding the record
+    """
+    return HEADER.unpack_from(data)[2]
+
+
+def unpack_event(data):
+    """
+    Decode a packed record into an Event
+    """
+    (header, strs, detail) = _unpack(data)
+    (version, uid, etype, how) = strs
+
+    ret = Event(
+        version=version,
+        uid=uid,
+        etype=etype,
+        how=how,
+        time=_from_ms(header[3]),
+        start=_from_ms(header[4]),
+        stale=_from_ms(header[5]),
+    )
+    ret.point = Point(*header[6:11])
+
+    detail = _detail_xml(detail)
+    if detail:
+        try:
+            parser = etree.XMLParser(resolve_entities=False)
+            elm = etree.fromstring(detail, parser)
+            ret.detail = Event.detail_from_elm(elm, uid)
+        except (TypeError, ValueError, AttributeError) as exc:
+            raise UnmarshalError("Issue parsing detail") from exc
+
+    return ret
+
+
+def unpack_wire(data):
+    """
+    Decode a packed record straight to the XML of the event, without building
+    an Event. The XML is equivalent to Event.as_bytes.
+    """
+    (header, strs, detail) = _unpack(data)
+    (version, uid, etype, how) = (escape(val, ATTR_ENTITIES) for val in strs)
+    (time, start, stale) = (format_cot_time(_from_ms(msec)) for msec in header[3:6])
+
+    return b"".join(
+        [
+            (
+                f'<event version="{version}" uid="{uid}" type="{etype}" '
+                f'how="{how}" time="{time}" start="{start}" stale="{stale}">'
+                '<point lat="%.6f" lon="%.6f" hae="%.1f" ce="%.1f" le="%.1f"/>'
+                % header[6:11]
+            ).encode(),
+            _detail_xml(detail),
+            b"</event>",
+        ]
+    )
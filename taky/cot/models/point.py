@@ -13,6 +13,8 @@ class Point:
     All other units are in meters.
     """
 
+    __slots__ = ("lat", "lon", "hae", "ce", "le")
+
     def __init__(self, lat=0.0, lon=0.0, hae=0.0, ce=9999999.0, le=9999999.0):
         self.lat = lat
         self.lon = lon
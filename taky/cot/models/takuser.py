@@ -8,6 +8,8 @@ TAKUSER_TAGS = set(["takv", "contact", "__group"])
 
 
 class TAKDevice:
+    __slots__ = ("os", "version", "device", "platform")
+
     def __init__(self, os=None, version=None, device=None, platform=None):
         self.os = os  # pylint: disable=invalid-name
         self.version = version
@@ -41,8 +43,23 @@ class TAKDevice:
 
 
 class TAKUser(Detail):
-    def __init__(self, elm):
-        super().__init__(elm)
+    __slots__ = (
+        "uid",
+        "callsign",
+        "marker",
+        "group",
+        "role",
+        "phone",
+        "xmpp",
+        "endpoint",
+        "course",
+        "speed",
+        "battery",
+        "device",
+    )
+
+    def __init__(self, elm, scan=None):
+        super().__init__(elm, scan)
 
         self.uid = None
         self.callsign = None
@@ -68,28 +85,37 @@ class TAKUser(Detail):
         return TAKUSER_TAGS.issubset(tags)
 
     @staticmethod
-    def from_elm(elm, uid):
-        ret = TAKUser(elm)
+    def from_elm(elm, uid, scan=None):
+        ret = TAKUser(elm, scan)
         ret.uid = uid
-
-        for d_elm in elm.iterchildren():
-            if d_elm.tag == "takv":
-                ret.device = TAKDevice.from_elm(d_elm)
-            elif d_elm.tag == "contact":
-                ret.callsign = d_elm.get("callsign")
-                ret.phone = d_elm.get("phone")
-                ret.endpoint = d_elm.get("endpoint")
-            elif d_elm.tag == "__group":
-                try:
-                    ret.group = Teams(d_elm.get("name"))
-                except ValueError:
-                    ret.group = Teams.UNKNOWN
-                ret.role = d_elm.get("role")
-            elif d_elm.tag == "status":
-                ret.battery = d_elm.get("battery")
-            elif d_elm.tag == "track":
-                ret.course = float(d_elm.get("course"))
-                ret.speed = float(d_elm.get("speed"))
+        children = ret.scan.children
+
+        d_elm = children.get("takv")
+        if d_elm is not None:
+            ret.device = TAKDevice.from_elm(d_elm)
+
+        d_elm = children.get("contact")
+        if d_elm is not None:
+            ret.callsign = d_elm.get("callsign")
+            ret.phone = d_elm.get("phone")
+            ret.endpoint = d_elm.get("endpoint")
+
+        d_elm = children.get("__group")
+        if d_elm is not None:
+            try:
+                ret.group = Teams(d_elm.get("name"))
+            except ValueError:
+                ret.group = Teams.UNKNOWN
+            ret.role = d_elm.get("role")
+
+        d_elm = children.get("status")
+        if d_elm is not None:
+            ret.battery = d_elm.get("battery")
+
+        d_elm = children.get("track")
+        if d_elm is not None:
+            ret.course = float(d_elm.get("course"))
+            ret.speed = float(d_elm.get("speed"))
 
         return ret
 
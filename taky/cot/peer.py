@@ -0,0 +1,210 @@
+"""
+Support for running taky as several worker processes.
+
+Each worker accepts clients on the same port (SO_REUSEPORT), and routes
+events for its own clients. Every event a worker routes is also published
+to its PeerLink. The parent process runs a Hub, which relays events from
+each worker to all the others, so they can deliver them to their own
+clients.
+
+Events on the hub sockets are framed with a 4 byte big endian length.
+"""
+import struct
+import selectors
+import logging
+
+from taky.config import app_config
+from .client import SocketClient, SocketTAKClient, TAKClient
+
+FRAME_HDR = struct.Struct("!I")
+
+
+class FrameBuffer:
+    """
+    Reassemble length prefixed frames from a byte stream
+    """
+
+    def __init__(self):
+        self.buff = bytearray()
+
+    def feed(self, data):
+        """
+        Add data to the buffer, and return a list of complete frames. Each
+        frame includes its header.
+        """
+        self.buff += data
+
+        frames = []
+        pos = 0
+        while len(self.buff) - pos >= FRAME_HDR.size:
+            (length,) = FRAME_HDR.unpack_from(self.buff, pos)
+            end = pos + FRAME_HDR.size + length
+            if end > len(self.buff):
+                break
+
+            frames.append(bytes(self.buff[pos:end]))
+            pos = end
+
+        del self.buff[:pos]
+        return frames
+
+
+class PeerLink(SocketTAKClient):
+    """
+    A worker's connection to the hub. It looks like a client to the router,
+    but events it receives are only delivered to local clients, and events
+    routed locally are published to the other workers through it.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.peer = True
+        self.frames = FrameBuffer()
+
+        # The link to the other workers must never drop events
+        self.log_cot_dir = None
+        self.tx_high_water = 0
+        self.tx_coalesce = False
+
+    def __repr__(self):
+        return "<PeerLink>"
+
+    def feed(self, data):
+        for frame in self.frames.feed(data):
+            TAKClient.feed(self, frame[FRAME_HDR.size :])
+
+    def send_event(self, event):
+        """
+        Publish an event to the other workers
+        """
+        data = event.as_bytes
+        self.send_data(FRAME_HDR.pack(len(data)))
+        self.send_data(data)
+
+    def handle_atom(self, evt):
+        # Peers carry events from many users, never a single identity
+        return
+
+
+class HubLink(SocketClient):
+    """
+    The hub's connection to a worker
+    """
+
+    def __init__(self, hub, **kwargs):
+        self.hub = hub
+        self.frames = FrameBuffer()
+
+        self.tx_high_water = app_config.getint("cot_server", "tx_high_water")
+        self.tx_low_water = app_config.getint("cot_server", "tx_low_water")
+        self.tx_policy = app_config.get("cot_server", "slow_client_policy")
+        self.tx_congested = False
+        self.tx_dropped = 0
+
+        super().__init__(**kwargs)
+
+    def feed(self, data):
+        for frame in self.frames.feed(data):
+            self.hub.relay(self, frame)
+
+    def send_frame(self, frame):
+        """
+        Queue a frame for the worker, applying the slow client policy.
+
+        The hub does not decode the events it relays, so once the send queue
+        grows past tx_high_water, new frames are dropped until it drains below
+        tx_low_water. With the disconnect policy, the worker is disconnected
+        instead, which stops the server.
+
+        @return False if the frame was not queued
+        """
+        if self.tx_high_water > 0:
+            if self.tx_congested and self.out_len <= self.tx_low_water:
+                self.lgr.info("Send queue drained (%d bytes)", self.out_len)
+                self.tx_congested = False
+            elif not self.tx_congested and self.out_len >= self.tx_high_water:
+                self.lgr.warning(
+                    "Send queue full (%d bytes), applying %s policy",
+                    self.out_len,
+                    self.tx_policy,
+                )
+                self.tx_congested = True
+
+        if self.tx_congested:
+            if self.tx_policy == "disconnect":
+                self.disconnect("Send queue full")
+            else:
+                self.tx_dropped += 1
+            return False
+
+        self.send_data(frame)
+        return True
+
+
+class Hub:
+    """
+    Runs in the parent process, and relays events between workers
+    """
+
+    def __init__(self):
+        self.lgr = logging.getLogger(self.__class__.__name__)
+        self.sel = selectors.DefaultSelector()
+        self.links = []
+
+    def add_worker(self, sock):
+        """
+        Add the hub side of a worker's socket pair
+        """
+        sock.setblocking(False)
+        link = HubLink(self, sock=sock)
+        self.sel.register(link.sock_fd, selectors.EVENT_READ, link)
+        self.links.append(link)
+
+    def relay(self, src, frame):
+        """
+        Send a frame to every worker except the one it came from
+        """
+        for link in self.links:
+            if link is not src and not link.is_closed:
+                link.send_frame(frame)
+
+    def loop(self):
+        """
+        Relay frames between workers. Returns False if a worker has gone away.
+        """
+        if any(link.is_closed for link in self.links):
+            return False
+
+        for link in self.links:
+            events = selectors.EVENT_READ
+            if link.has_data:
+                events |= selectors.EVENT_WRITE
+            self.sel.modify(link.sock_fd, events, link)
+
+        for (key, events) in self.sel.select(1):
+            link = key.data
+            if events & selectors.EVENT_READ and not link.is_closed:
+                link.socket_rx()
+            if events & selectors.EVENT_WRITE and not link.is_closed:
+                link.socket_tx()
+
+        return not any(link.is_closed for link in self.links)
+
+    def close(self):
+        """
+        Close all worker sockets
+        """
+        for link in self.links:
+            link.disconnect("Hub closing")
+        self.links = []
+        self.sel.close()
+
+    def detach(self):
+        """
+        Release the hub's sockets in a forked worker, without shutting down
+        the connections the parent is still using
+        """
+        for link in self.links:
+            link.sock.close()
+        self.links = []
+        self.sel.close()
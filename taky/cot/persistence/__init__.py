@@ -0,0 +1,76 @@
+"""
+A collection of classes that implement persistence
+
+Currently, this class is only designed to track broadcast items, like markers,
+atom locations, and map drawings. A brief description of some event types
+follows.
+
+Atoms:
+  a-f-G-U-C / User Update (f-G-U-C) points
+  a-u-G / Marker
+
+Bits:
+  b-m-p-w-GOTO # Go to this thing
+  b-m-p-s-p-i # Digital Pointer (cuepoint)
+  b-m-p (Generic point prefix, log all)
+  b-f-t-r / Picture / File download request (Don't log)
+  b-r-f-h-c / EVAC
+  b-t-f / GeoChat
+  b-a-o-tbl / Emergency
+  b-a-o-can / Emergency canceled
+
+User (?) Drawings
+  u-d-c / Drawing (circle)
+  u-d-r / Drawing (rectangle)
+  u-d-f / Drawing (line / polygon)
+
+UDP Like Commands
+  t-x-c-t / Ping
+  c - Capability
+  r - Reply
+"""
+
+from taky.config import app_config as config
+from .base import (
+    BasePersistence,
+    KEPT_EVENTS,
+    EXPIRY_SLACK,
+    kept_types_matcher,
+    event_digest,
+    decode_event,
+    decode_wire,
+)
+from .memstore import Persistence
+from .redisstore import RedisPersistence
+from .sqlitestore import SqlitePersistence
+
+
+def build_persistence():
+    """
+    Factory method to build a Persistence object from the given config
+    """
+    binary = config.getboolean("persistence", "binary")
+    rds_args = {
+        "binary": binary,
+        "write_behind": config.getboolean("persistence", "write_behind"),
+        "queue_max": config.getint("persistence", "queue_max"),
+        "cache_size": config.getint("persistence", "cache_size"),
+        "cache_ttl": config.getint("persistence", "cache_ttl"),
+        "keyspace_events": config.getboolean("persistence", "keyspace_events"),
+    }
+
+    try:
+        if config.getboolean("taky", "redis"):
+            return RedisPersistence(config.get("taky", "hostname"), **rds_args)
+    except (AttributeError, ValueError):
+        conn_str = config.get("taky", "redis")
+        if conn_str:
+            return RedisPersistence(
+                config.get("taky", "hostname"), conn_str, **rds_args
+            )
+
+    db_path = config.get("persistence", "sqlite")
+    if db_path:
+        return SqlitePersistence(db_path, binary=binary)
+
+    return Persistence(binary=binary)
@@ -0,0 +1,283 @@
+"""
+The event type matching, encoding and duplicate checks shared by all of the
+persistence stores
+"""
+import hashlib
+import time
+import logging
+
+from lxml import etree
+
+from taky.config import app_config as config
+from taky.util import PrefixMatcher
+from .. import models
+from ..models import packed
+
+KEPT_EVENTS = [
+    "a-",
+    "b-m-p",
+    "b-r-f-h-c",
+    "u-d-c",
+    "u-d-r",
+    "u-d-f",
+]
+
+
+# Seconds a re-broadcast may expire before the stored copy, and still be
+# treated as a duplicate (TTLs are rounded to whole seconds)
+EXPIRY_SLACK = 1
+
+# Matchers for the kept_types setting, shared by all users of a setting
+KEPT_MATCHERS = {}
+
+
+def kept_types_matcher():
+    """
+    Returns a PrefixMatcher for the event types kept by the persistence
+    store, as set by kept_types in the config (or KEPT_EVENTS)
+    """
+    setting = config.get("persistence", "kept_types")
+    matcher = KEPT_MATCHERS.get(setting)
+    if matcher is None:
+        if setting in [None, ""]:
+            prefixes = KEPT_EVENTS
+        else:
+            prefixes = [pfx.strip() for pfx in setting.split(",") if pfx.strip()]
+
+        matcher = PrefixMatcher(prefixes)
+        KEPT_MATCHERS[setting] = matcher
+
+    return matcher
+
+
+def event_digest(event):
+    """
+    Hash the content of an event, ignoring its time, start and stale times.
+    Everything after the opening <event> tag (the point and detail) is
+    hashed, along with the event type and how.
+    """
+    wire = event.as_bytes
+    body = wire[wire.find(b">") + 1 :]
+
+    ret = hashlib.blake2b(digest_size=16)
+    ret.update(f"{event.etype}\0{event.how}\0".encode())
+    ret.update(body)
+    return ret.digest()
+
+
+def decode_event(data):
+    """
+    Build an Event from its stored form, either XML or a packed record
+
+    @raise UnmarshalError, etree.XMLSyntaxError
+    """
+    if packed.is_packed(data):
+        return packed.unpack_event(data)
+
+    parser = etree.XMLParser(resolve_entities=False)
+    parser.feed(data)
+    elm = parser.close()
+
+    return models.Event.from_elm(elm, wire=data)
+
+
+def decode_wire(data):
+    """
+    Return the XML of an event from its stored form, either XML or a packed
+    record
+
+    @raise UnmarshalError
+    """
+    if packed.is_packed(data):
+        return packed.unpack_wire(data)
+
+    return data
+
+
+class BasePersistence:
+    # True if the store is shared between taky processes
+    shared = False
+
+    def __init__(self, binary=False):
+        self.lgr = logging.getLogger(self.__class__.__name__)
+        self.kept_types = kept_types_matcher()
+
+        # Store events as packed records, instead of XML
+        self.binary = binary
+        # Bytes saved by packing, summed over every event written since
+        # startup. Rewrites of the same event are counted each time, so this
+        # is write volume saved, not the space saved in the store.
+        self.binary_written_saved = 0
+
+        # The content digest and expiry time of each stored event,
+        # {uid: (digest, expires)}
+        self.digests = {}
+        self.digests_swept = 0
+        self.duplicates = 0
+
+    def encode(self, event):
+        """
+        Return the stored form of an event
+        """
+        if not self.binary:
+            return event.as_bytes
+
+        record = packed.pack_event(event)
+        self.binary_written_saved += len(event.as_bytes) - len(record)
+        return record
+
+    def track(self, event, stored=False):
+        """
+        Add an event to the store, if it is of a type that is kept.
+
+        Clients re-broadcast unchanged events periodically. If the event has
+        the same content as the stored copy, and the stored copy is good for
+        at least half of the new TTL, it is not written again. (Writing only
+        the new TTL would leave the stored copy with stale times that are
+        already past when it is replayed.) An event which expires earlier
+        than the stored copy is always written, so a sender can shorten it.
+
+        @param stored True if another process has already written the event
+                      to this (shared) store
+        @return True if the event is an unchanged re-broadcast of the stored
+                copy, otherwise False
+        """
+        if not self.kept_types.match(event.etype):
+            return False
+
+        ttl = event.persist_ttl
+        if not ttl or ttl < 0:
+            return False
+
+        now = time.time()
+        if now - self.digests_swept > 10:
+            self.digests_swept = now
+            self.digests = {
+                uid: val for (uid, val) in self.digests.items() if val[1] > now
+            }
+
+        digest = event_digest(event)
+        expires = now + ttl
+        prev = self.digests.get(event.uid)
+        if (
+            prev
+            and prev[0] == digest
+            and prev[1] - now >= ttl / 2
+            and expires >= prev[1] - EXPIRY_SLACK
+        ):
+            self.duplicates += 1
+            return True
+
+        self.digests[event.uid] = (digest, expires)
+
+        if stored:
+            self.cache_event(event, ttl)
+            return False
+
+        self.lgr.debug("Tracking: %s (ttl: %d)", event, ttl)
+        self.track_event(event, ttl)
+        return False
+
+    def track_event(self, event, ttl):
+        """
+        Add the event to the database
+        """
+        raise NotImplementedError()
+
+    def _load_event(self, uid, data):
+        """
+        Decode an Event read from the store. If it can not be decoded, it is
+        purged from the store.
+        """
+        try:
+            return decode_event(data)
+        except (models.UnmarshalError, etree.XMLSyntaxError) as exc:
+            self.lgr.warning("Unable to parse Event from persistence store: %s", exc)
+        except Exception as exc:  # pylint: disable=broad-except
+            self.lgr.error(
+                "Uhandled exception parsing Event from persistence store: %s", exc
+            )
+
+        self._purge([uid])
+        return None
+
+    def _load_wire(self, uid, data):
+        """
+        Return the XML of an event read from the store. If it can not be
+        decoded, it is purged from the store.
+        """
+        try:
+            return decode_wire(data)
+        except models.UnmarshalError as exc:
+            self.lgr.warning("Unable to parse Event from persistence store: %s", exc)
+
+        self._purge([uid])
+        return b""
+
+    def _purge(self, uids):  # pylint: disable=unused-argument
+        """
+        Remove events which could not be decoded. Stores which use
+        _load_event() or _load_wire() must implement this.
+        """
+        return
+
+    def cache_event(self, event, ttl):  # pylint: disable=unused-argument
+        """
+        Note an event already in the database, for backends with a local cache
+        """
+        return
+
+    def get_all(self):
+        """
+        Return all items tracked
+        """
+        raise NotImplementedError()
+
+    def get_all_wire(self, exclude_uid=None):
+        """
+        Return all items tracked, serialized into one bytes object
+
+        @param exclude_uid A UID to leave out (ie: the client's own self-SA)
+        """
+        return b"".join(
+            evt.as_bytes for evt in self.get_all() if evt.uid != exclude_uid
+        )
+
+    def get_event(self, uid):
+        """
+        Return a specific Event by UID. Returns None if the event does not
+        exist.
+        """
+        raise NotImplementedError()
+
+    def event_exists(self, uid):
+        """
+        Return true if the event exists
+        """
+        raise NotImplementedError()
+
+    def prune(self):
+        """
+        Prune the collection
+        """
+        # In this case, assume nothing needs to be done
+        return
+
+    def status(self):
+        """
+        Return a dictionary of statistics for the management socket
+        """
+        return {"duplicates": self.duplicates}
+
+    def flush(self):
+        """
+        Commit any writes batched since the last flush. Called once per
+        server loop.
+        """
+        return
+
+    def close(self):
+        """
+        Finish any outstanding work, and release resources
+        """
+        return
@@ -0,0 +1,171 @@
+# pylint: disable=missing-module-docstring
+from datetime import datetime as dt
+import heapq
+
+from .. import models
+from ..models import packed
+from .base import BasePersistence
+
+
+class Persistence(BasePersistence):
+    """
+    A simple memory based persistence object. Events are stored as objects in a
+    dictionary. Whenever the dictionary is updated or accessed, it is pruned.
+
+    Stale times are kept in a min-heap, so pruning only looks at the events
+    which have expired. When an event is replaced, its old heap entry is left
+    behind, and skipped when it is popped.
+
+    Events are kept compacted (see LazyEvent.compact()), so the store holds
+    the XML of each event rather than its lxml tree. In binary mode, events
+    are kept as packed records instead, which uses even less memory, at the
+    cost of decoding them on replay.
+
+    Replays are served from a snapshot of all events, serialized into one
+    bytes object. The snapshot is rebuilt at most once per server loop
+    (each flush()). Until then, events tracked since the snapshot are sent
+    after it, so a replay may hold an older copy of an event ahead of the
+    newer one, or an event which has just been pruned.
+
+    This object has no long term storage. If taky quits, all the objects are
+    lost.
+    """
+
+    def __init__(self, binary=False):
+        super().__init__(binary)
+        # {uid: LazyEvent}, or {uid: record} in binary mode
+        self.events = {}
+        # Min-heap of (stale, uid)
+        self.stale_heap = []
+        # All events serialized, built on demand. UIDs tracked since, and
+        # whether any were pruned, decide when it is rebuilt.
+        self.wire = None
+        self.wire_tick = -1
+        self.wire_changed = {}
+        self.wire_pruned = False
+        # Incremented by each flush()
+        self.tick = 0
+        # Size of the packed records, and of the same events as XML
+        self.stored_bytes = 0
+        self.xml_bytes = 0
+
+    def _stale(self, item):
+        if self.binary:
+            return packed.packed_stale(item)
+        return item.stale
+
+    def _event(self, item):
+        if self.binary:
+            return packed.unpack_event(item)
+        return item
+
+    def _wire(self, item):
+        if self.binary:
+            return packed.unpack_wire(item)
+        return item.as_bytes
+
+    def _forget(self, uid):
+        item = self.events.pop(uid, None)
+        if item is not None and self.binary:
+            self.stored_bytes -= len(item)
+            self.xml_bytes -= packed.packed_xml_size(item)
+
+    def track_event(self, event, ttl):
+        self._forget(event.uid)
+        if self.binary:
+            item = packed.pack_event(event)
+            self.stored_bytes += len(item)
+            self.xml_bytes += len(event.as_bytes)
+        else:
+            item = models.LazyEvent.compact(event)
+
+        self.events[event.uid] = item
+        if self.wire is not None:
+            self.wire_changed[event.uid] = True
+        heapq.heappush(self.stale_heap, (self._stale(item), event.uid))
+
+        # Don't let replaced entries pile up if stale times are long
+        if len(self.stale_heap) > 2 * len(self.events) + 1024:
+            self.stale_heap = [
+                (self._stale(item), uid) for (uid, item) in self.events.items()
+            ]
+            heapq.heapify(self.stale_heap)
+
+        self.prune()
+
+    def event_exists(self, uid):
+        return uid in self.events
+
+    def get_event(self, uid):
+        self.prune()
+        item = self.events.get(uid)
+        if item is None:
+            return None
+
+        return self._event(item)
+
+    def get_all(self):
+        self.prune()
+        if self.binary:
+            return [self._event(item) for item in self.events.values()]
+
+        return self.events.values()
+
+    def get_all_wire(self, exclude_uid=None):
+        self.prune()
+        if exclude_uid in self.events:
+            return b"".join(
+                self._wire(item)
+                for (uid, item) in self.events.items()
+                if uid != exclude_uid
+            )
+
+        dirty = self.wire_changed or self.wire_pruned
+        if self.wire is None or (dirty and self.wire_tick != self.tick):
+            self.wire = b"".join(self._wire(item) for item in self.events.values())
+            self.wire_tick = self.tick
+            self.wire_changed = {}
+            self.wire_pruned = False
+
+        if not self.wire_changed:
+            return self.wire
+
+        # Events tracked this tick follow the snapshot
+        return self.wire + b"".join(
+            self._wire(self.events[uid])
+            for uid in self.wire_changed
+            if uid in self.events
+        )
+
+    def prune(self):
+        """
+        Delete items that have expired
+        """
+        now = dt.utcnow()
+
+        while self.stale_heap and self.stale_heap[0][0] < now:
+            (stale, uid) = heapq.heappop(self.stale_heap)
+            item = self.events.get(uid)
+            if item is None:
+                continue
+
+            # Skip entries for events which have since been replaced
+            item_stale = self._stale(item)
+            if item_stale != stale and item_stale >= now:
+                continue
+
+            self.lgr.info("Pruning %s, stale is %s", uid, item_stale)
+            self._forget(uid)
+            self.wire_pruned = True
+
+    def flush(self):
+        self.tick += 1
+
+    def status(self):
+        ret = super().status()
+        ret["events"] = len(self.events)
+        if self.binary:
+            ret["stored_bytes"] = self.stored_bytes
+            ret["binary_saved"] = self.xml_bytes - self.stored_bytes
+
+        return ret
@@ -0,0 +1,571 @@
+# pylint: disable=missing-module-docstring
+import time
+import collections
+import threading
+
+import redis
+
+from .. import models
+from .base import BasePersistence
+
+
+class RedisPersistence(BasePersistence):
+    """
+    A Redis backed persistence object, useful for keeping track of events,
+    even if taky restarts. This also allows other systems which can
+    communicate with Redis to access the events.
+
+    Events are stored as raw XML, with an expiry set, so Redis automatically
+    prunes events. Each event is written with one pipelined round trip.
+
+    The events are stored under the following keyspace:
+      taky:{keyspace}:persist:{event.uid} = <xml>
+
+    A sorted set of UIDs, scored by the time the event expires, indexes the
+    events so they can be counted and listed without walking the keyspace:
+      taky:{keyspace}:persist_idx = {event.uid: <expiry>}
+
+    On startup, the keyspace is only walked to rebuild the index if the index
+    is missing, or the version recorded with it does not match:
+      taky:{keyspace}:persist_idx_version = <index_version>
+
+    In most configurations, keyspace should be the hostname.
+
+    In write behind mode, track_event() only queues the event. A background
+    thread writes queued events to Redis in pipelined batches, so a slow
+    Redis server does not stall routing. Only the newest event for a UID is
+    queued, and if the queue holds queue_max UIDs, new UIDs are dropped until
+    it drains. Reads check the queue first, so queued events are not lost
+    from replays.
+
+    Recently used events are cached in memory, so replays do not need to
+    fetch and parse every event from Redis. Tracked events are written
+    through the cache. Other processes may update events in Redis, so cached
+    events are only trusted for cache_ttl seconds. If keyspace_events is set,
+    events are also dropped from the cache as soon as they change in Redis.
+    (Redis must be configured with "notify-keyspace-events K$gx")
+    """
+
+    shared = True
+
+    # Number of keys fetched per MGET
+    batch_size = 500
+    # Bumped when the index needs to be rebuilt from the keyspace
+    index_version = b"1"
+    # Seconds close() waits for the write behind queue to be flushed
+    close_timeout = 5
+
+    def __init__(
+        self,
+        keyspace=None,
+        conn_str=None,
+        write_behind=False,
+        queue_max=0,
+        cache_size=0,
+        cache_ttl=0,
+        keyspace_events=False,
+        binary=False,
+    ):
+        super().__init__(binary)
+        self.rds_ok = True
+        if keyspace:
+            self.rds_ks = f"taky:{keyspace}:persist"
+        else:
+            self.rds_ks = "taky:persist"
+        self.rds_idx = f"{self.rds_ks}_idx"
+        self.rds_idx_version = f"{self.rds_idx}_version"
+
+        if conn_str:
+            self.lgr.info("Connecting to %s", conn_str)
+            self.rds = redis.StrictRedis.from_url(conn_str)
+        else:
+            self.lgr.info("Connecting to default redis")
+            self.rds = redis.StrictRedis()
+
+        try:
+            if self.index_stale():
+                self.lgr.info("Rebuilding the index")
+                self.rebuild_index()
+            self.lgr.info("Tracking %d items", self.rds.zcard(self.rds_idx))
+            self._redis_result(True)
+        except redis.ConnectionError:
+            self._redis_result(False)
+
+        # LRU cache of {uid: [expires, event, xml]}, least recently used first
+        self.cache = collections.OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache_stats = {"hits": 0, "misses": 0}
+        # Notifications still due for our own writes, {uid: count}
+        self.own_writes = collections.Counter()
+        self.notify_thread = None
+        if cache_size and keyspace_events:
+            self._subscribe()
+
+        # Write behind queue, {uid: (xml, ttl)}
+        self.wb_lock = threading.Condition()
+        self.wb_queue = {}
+        self.wb_max = queue_max
+        self.wb_closing = False
+        self.wb_stats = {
+            "queued": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "failed": 0,
+            "flushes": 0,
+            "flush_latency": 0.0,
+            "flush_latency_max": 0.0,
+        }
+        self.wb_thread = None
+        if write_behind:
+            self.lgr.info("Writing to redis in the background")
+            self.wb_thread = threading.Thread(
+                target=self._write_behind, name="RedisWriteBehind", daemon=True
+            )
+            self.wb_thread.start()
+
+    def _redis_result(self, result):
+        """
+        Simple set/reset latch to notify the user if the connection to the
+        redis server is lost
+        """
+        if self.rds_ok and not result:
+            self.lgr.warning("Lost connection to redis")
+        elif not self.rds_ok and result:
+            self.lgr.warning("Connection to redis restored")
+
+        self.rds_ok = result
+
+    def index_stale(self):
+        """
+        Returns True if the index is missing, or was built by another version
+        """
+        if not self.rds.exists(self.rds_idx):
+            return True
+
+        return self.rds.get(self.rds_idx_version) != self.index_version
+
+    def rebuild_index(self):
+        """
+        Add any events in the keyspace which are missing from the index (ie:
+        written by an older version of taky), then record the index version.
+        The keyspace is walked with SCAN, so Redis is not blocked while this
+        runs.
+        """
+        prefix_len = len(self.rds_ks) + 1
+        now = time.time()
+
+        keys = []
+        for key in self.rds.scan_iter(match=f"{self.rds_ks}:*", count=self.batch_size):
+            keys.append(key)
+            if len(keys) >= self.batch_size:
+                self._index_keys(keys, prefix_len, now)
+                keys = []
+
+        if keys:
+            self._index_keys(keys, prefix_len, now)
+
+        self.rds.set(self.rds_idx_version, self.index_version)
+
+    def _index_keys(self, keys, prefix_len, now):
+        pipe = self.rds.pipeline(transaction=False)
+        for key in keys:
+            pipe.ttl(key)
+
+        mapping = {}
+        for (key, ttl) in zip(keys, pipe.execute()):
+            if ttl is None or ttl < 0:
+                continue
+            mapping[key[prefix_len:]] = now + ttl
+
+        if mapping:
+            self.rds.zadd(self.rds_idx, mapping)
+
+    def track_event(self, event, ttl):
+        self._cache_put(
+            event.uid, time.time() + ttl, event=models.LazyEvent.compact(event)
+        )
+
+        if self.wb_thread:
+            self._enqueue(event.uid, self.encode(event), ttl)
+            return
+
+        try:
+            self._write({event.uid: (self.encode(event), ttl)})
+            self._redis_result(True)
+        except redis.ConnectionError:
+            self._redis_result(False)
+
+    def cache_event(self, event, ttl):
+        self._cache_put(
+            event.uid, time.time() + ttl, event=models.LazyEvent.compact(event)
+        )
+
+    def _write(self, events):
+        """
+        Write events to Redis in one pipeline
+
+        @param events A dictionary of {uid: (xml, ttl)}
+        """
+        now = time.time()
+        pipe = self.rds.pipeline(transaction=False)
+        for (uid, (xml, ttl)) in events.items():
+            pipe.set(f"{self.rds_ks}:{uid}", xml, ex=ttl)
+        pipe.zadd(self.rds_idx, {uid: now + ttl for (uid, (_, ttl)) in events.items()})
+
+        # The notifications for these writes must not evict what was just
+        # cached. They may arrive before execute() returns.
+        if self.notify_thread:
+            with self.cache_lock:
+                self.own_writes.update(events.keys())
+
+        try:
+            pipe.execute()
+        except redis.RedisError:
+            if self.notify_thread:
+                with self.cache_lock:
+                    self.own_writes.subtract(events.keys())
+                    # Drop the counts which are back to 0
+                    self.own_writes += collections.Counter()
+            raise
+
+    def _enqueue(self, uid, xml, ttl):
+        with self.wb_lock:
+            if uid in self.wb_queue:
+                self.wb_stats["coalesced"] += 1
+            elif self.wb_max and len(self.wb_queue) >= self.wb_max:
+                self.wb_stats["dropped"] += 1
+                return
+            else:
+                self.wb_stats["queued"] += 1
+
+            self.wb_queue[uid] = (xml, ttl)
+            self.wb_lock.notify()
+
+    def _write_behind(self):
+        """
+        Background thread, which flushes the write behind queue
+        """
+        while True:
+            with self.wb_lock:
+                while not self.wb_queue and not self.wb_closing:
+                    self.wb_lock.wait()
+
+                if not self.wb_queue:
+                    return
+
+                batch = self.wb_queue
+                self.wb_queue = {}
+
+            start = time.time()
+            try:
+                self._write(batch)
+                self._redis_result(True)
+            except (redis.ConnectionError, redis.TimeoutError) as exc:
+                self._redis_result(False)
+                self.lgr.debug("Write behind failed: %s", exc)
+
+                # Requeue the batch, unless a newer event has been queued
+                with self.wb_lock:
+                    for (uid, val) in batch.items():
+                        self.wb_queue.setdefault(uid, val)
+                    if self.wb_closing:
+                        return
+
+                time.sleep(1)
+                continue
+            except redis.RedisError as exc:
+                # An error reply will not go away by retrying the batch
+                self.lgr.error("Unable to write %d events: %s", len(batch), exc)
+                with self.wb_lock:
+                    self.wb_stats["failed"] += len(batch)
+                continue
+
+            latency = time.time() - start
+            with self.wb_lock:
+                self.wb_stats["flushes"] += 1
+                self.wb_stats["flush_latency"] = latency
+                self.wb_stats["flush_latency_max"] = max(
+                    latency, self.wb_stats["flush_latency_max"]
+                )
+
+    def _queued(self):
+        """
+        Return a copy of the write behind queue
+        """
+        if not self.wb_thread:
+            return {}
+
+        with self.wb_lock:
+            return dict(self.wb_queue)
+
+    def event_exists(self, uid):
+        return self._event_exists(uid)
+
+    def _event_exists(self, uid, uid_is_redis_key=False):
+        if uid_is_redis_key:
+            key = uid
+        else:
+            key = f"{self.rds_ks}:{uid}"
+
+        exists = False
+
+        try:
+            exists = self.rds.exists(key) > 0
+            self._redis_result(True)
+        except redis.ConnectionError:
+            self._redis_result(False)
+
+        return exists
+
+    def get_event(self, uid):
+        entry = self._cache_get(uid, time.time())
+        if entry:
+            return self._entry_event(uid, entry)
+
+        queued = self._queued().get(uid)
+        if queued:
+            return self._load_event(uid, queued[0])
+
+        try:
+            xml = self.rds.get(f"{self.rds_ks}:{uid}")
+            self._redis_result(True)
+        except redis.ResponseError as exc:
+            self.lgr.warning("Unable to get Event from persistence store: %s", exc)
+            self._purge([uid])
+            return None
+        except redis.ConnectionError:
+            self._redis_result(False)
+            return None
+
+        if xml is None:
+            return None
+
+        return self._load_event(uid, xml)
+
+    def _purge(self, uids):
+        """
+        Remove events, and their index entries
+        """
+        self.lgr.warning("Purging keys %s", ", ".join(str(uid) for uid in uids))
+        with self.cache_lock:
+            for uid in uids:
+                self.cache.pop(uid, None)
+
+        try:
+            pipe = self.rds.pipeline(transaction=False)
+            pipe.delete(*[f"{self.rds_ks}:{uid}" for uid in uids])
+            pipe.zrem(self.rds_idx, *uids)
+            pipe.execute()
+        except:  # pylint: disable=bare-except
+            pass
+
+    def _cache_get(self, uid, now):
+        """
+        Return the cache entry for a UID, or None if it is not cached
+        """
+        if not self.cache_size:
+            return None
+
+        with self.cache_lock:
+            entry = self.cache.get(uid)
+            if entry is None or entry[0] < now:
+                self.cache.pop(uid, None)
+                self.cache_stats["misses"] += 1
+                return None
+
+            self.cache.move_to_end(uid)
+            self.cache_stats["hits"] += 1
+            return entry
+
+    def _cache_put(self, uid, expires, event=None, xml=None):
+        """
+        Cache an Event, or the XML it is stored as
+
+        @param expires The time the event expires in Redis
+        @return The cache entry, [expires, event, xml]
+        """
+        if self.cache_ttl:
+            expires = min(expires, time.time() + self.cache_ttl)
+        entry = [expires, event, xml]
+
+        if not self.cache_size:
+            return entry
+
+        with self.cache_lock:
+            self.cache[uid] = entry
+            self.cache.move_to_end(uid)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return entry
+
+    def _entry_event(self, uid, entry):
+        """
+        Return the Event for a cache entry, parsing it if required
+        """
+        if entry[1] is None:
+            entry[1] = self._load_event(uid, entry[2])
+            entry[2] = None
+
+        return entry[1]
+
+    def _keyspace_event(self, msg):
+        """
+        Keyspace notification handler. Drop the changed event from the cache,
+        unless this process wrote it.
+        """
+        uid = msg["channel"][self.notify_prefix_len :].decode()
+        with self.cache_lock:
+            if msg["data"] == b"set" and self.own_writes[uid] > 0:
+                self.own_writes[uid] -= 1
+                if not self.own_writes[uid]:
+                    del self.own_writes[uid]
+                return
+
+            self.cache.pop(uid, None)
+
+    def _subscribe(self):
+        """
+        Subscribe to keyspace notifications for the events
+        """
+        db_num = self.rds.connection_pool.connection_kwargs.get("db", 0)
+        prefix = f"__keyspace@{db_num}__:{self.rds_ks}:"
+        self.notify_prefix_len = len(prefix.encode())
+
+        try:
+            pubsub = self.rds.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{f"{prefix}*": self._keyspace_event})
+            self.notify_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        except redis.ConnectionError:
+            self.lgr.warning("Unable to subscribe to keyspace notifications")
+
+    def _get_all_entries(self):
+        """
+        Generator which yields (uid, entry) for every live event in the index,
+        where entry is a cache entry. Events which are not cached are fetched
+        with batched MGETs, sent through one pipeline.
+        """
+        now = time.time()
+        queued = self._queued()
+        for (uid, (xml, ttl)) in queued.items():
+            yield (uid, self._cache_get(uid, now) or [now + ttl, None, xml])
+
+        uncached = []
+        for (uid, score) in self.rds.zrangebyscore(
+            self.rds_idx, now, "+inf", withscores=True
+        ):
+            uid = uid.decode()
+            if uid in queued:
+                continue
+
+            entry = self._cache_get(uid, now)
+            if entry:
+                yield (uid, entry)
+            else:
+                uncached.append((uid, score))
+
+        pipe = self.rds.pipeline(transaction=False)
+        for idx in range(0, len(uncached), self.batch_size):
+            pipe.mget(
+                [
+                    f"{self.rds_ks}:{uid}"
+                    for (uid, _) in uncached[idx : idx + self.batch_size]
+                ]
+            )
+
+        missing = []
+        batches = zip(range(0, len(uncached), self.batch_size), pipe.execute())
+        for (idx, values) in batches:
+            for ((uid, score), xml) in zip(
+                uncached[idx : idx + self.batch_size], values
+            ):
+                if xml is None:
+                    missing.append(uid)
+                else:
+                    yield (uid, self._cache_put(uid, score, xml=xml))
+
+        # Index entries for events that were deleted, or expired early
+        if missing:
+            self.rds.zrem(self.rds_idx, *missing)
+
+    def get_all(self):
+        try:
+            for (uid, entry) in self._get_all_entries():
+                evt = self._entry_event(uid, entry)
+                if evt:
+                    yield evt
+            self._redis_result(True)
+        except redis.ConnectionError:
+            self._redis_result(False)
+            return
+
+    def get_all_wire(self, exclude_uid=None):
+        # The stored XML is already serialized, so skip parsing it
+        try:
+            ret = b"".join(
+                self._load_wire(uid, entry[2])
+                if entry[1] is None
+                else entry[1].as_bytes
+                for (uid, entry) in self._get_all_entries()
+                if uid != exclude_uid
+            )
+            self._redis_result(True)
+            return ret
+        except redis.ConnectionError:
+            self._redis_result(False)
+            return b""
+
+    def prune(self):
+        """
+        Drop index entries for expired events. Redis expires the events
+        themselves.
+        """
+        try:
+            self.rds.zremrangebyscore(self.rds_idx, "-inf", time.time())
+            self._redis_result(True)
+        except redis.ConnectionError:
+            self._redis_result(False)
+
+    def status(self):
+        ret = super().status()
+        if self.binary:
+            ret["binary_written_saved"] = self.binary_written_saved
+
+        if self.cache_size:
+            with self.cache_lock:
+                ret["cached"] = len(self.cache)
+                ret["cache_hits"] = self.cache_stats["hits"]
+                ret["cache_misses"] = self.cache_stats["misses"]
+
+        if self.wb_thread:
+            with self.wb_lock:
+                ret.update(self.wb_stats)
+                ret["queue_depth"] = len(self.wb_queue)
+
+        return ret
+
+    def close(self):
+        """
+        Flush the write behind queue, and stop background threads
+        """
+        if self.notify_thread:
+            self.notify_thread.stop()
+            self.notify_thread = None
+
+        if not self.wb_thread:
+            return
+
+        with self.wb_lock:
+            self.wb_closing = True
+            self.wb_lock.notify()
+
+        self.wb_thread.join(self.close_timeout)
+        if self.wb_thread.is_alive():
+            with self.wb_lock:
+                self.lgr.warning(
+                    "Gave up waiting for redis, %d events not written",
+                    len(self.wb_queue),
+                )
+        self.wb_thread = None
@@ -0,0 +1,141 @@
+# pylint: disable=missing-module-docstring
+import time
+import sqlite3
+
+from .base import BasePersistence
+
+
+class SqlitePersistence(BasePersistence):
+    """
+    A SQLite backed persistence object, for keeping events across restarts
+    without running a Redis server.
+
+    Events are stored as raw XML (or packed records, in binary mode), along
+    with the time they expire:
+      events(uid TEXT PRIMARY KEY, expires REAL, xml BLOB)
+
+    The database is opened in WAL mode, so readers (ie: a second worker) do
+    not block the writer. Tracked events are held in memory, and written in
+    a single transaction when flush() is called, once per server loop.
+    Expired events are deleted using an index on the expiry time.
+    """
+
+    shared = True
+
+    def __init__(self, path, binary=False):
+        super().__init__(binary)
+        self.lgr.info("Opening %s", path)
+        # The server may be built in a different thread than it runs in
+        self.db = sqlite3.connect(
+            path, isolation_level=None, timeout=5, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events "
+            "(uid TEXT PRIMARY KEY, expires REAL NOT NULL, xml BLOB NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_expires ON events (expires)")
+
+        # Writes waiting for the next flush, {uid: (expires, xml)}
+        self.pending = {}
+
+        self.prune()
+        self.lgr.info("Tracking %d items", self._count())
+
+    def _count(self):
+        (count,) = self.db.execute("SELECT COUNT(*) FROM events").fetchone()
+        return count
+
+    def track_event(self, event, ttl):
+        self.pending[event.uid] = (time.time() + ttl, self.encode(event))
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        try:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO events (uid, expires, xml) VALUES (?, ?, ?)",
+                [(uid, expires, xml) for (uid, (expires, xml)) in self.pending.items()],
+            )
+            self.db.execute("COMMIT")
+            self.pending = {}
+        except sqlite3.Error as exc:
+            self.lgr.warning("Unable to write to persistence store: %s", exc)
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+
+    def _purge(self, uids):
+        self.lgr.warning("Purging %s", ", ".join(str(uid) for uid in uids))
+        self.db.executemany(
+            "DELETE FROM events WHERE uid = ?", [(uid,) for uid in uids]
+        )
+
+    def event_exists(self, uid):
+        return self.get_event(uid) is not None
+
+    def get_event(self, uid):
+        self.flush()
+        row = self.db.execute(
+            "SELECT xml FROM events WHERE uid = ? AND expires > ?", (uid, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+
+        return self._load_event(uid, row[0])
+
+    def get_all(self):
+        self.flush()
+        rows = self.db.execute(
+            "SELECT uid, xml FROM events WHERE expires > ?", (time.time(),)
+        ).fetchall()
+
+        for (uid, xml) in rows:
+            evt = self._load_event(uid, xml)
+            if evt:
+                yield evt
+
+    def get_all_wire(self, exclude_uid=None):
+        # The stored XML is already serialized, so skip parsing it
+        self.flush()
+        rows = self.db.execute(
+            "SELECT uid, xml FROM events WHERE expires > ? AND uid IS NOT ?",
+            (time.time(), exclude_uid),
+        ).fetchall()
+        return b"".join(self._load_wire(uid, data) for (uid, data) in rows)
+
+    def prune(self):
+        """
+        Delete items that have expired
+        """
+        self.flush()
+        try:
+            cur = self.db.execute(
+                "DELETE FROM events WHERE expires <= ?", (time.time(),)
+            )
+            if cur.rowcount > 0:
+                self.lgr.info("Pruned %d items", cur.rowcount)
+        except sqlite3.Error as exc:
+            self.lgr.warning("Unable to prune persistence store: %s", exc)
+
+    def status(self):
+        ret = super().status()
+        ret["events"] = self._count()
+        ret["pending"] = len(self.pending)
+        if self.binary:
+            ret["binary_written_saved"] = self.binary_written_saved
+
+        return ret
+
+    def close(self):
+        """
+        Write any pending events, and close the database
+        """
+        if self.db is None:
+            return
+
+        self.flush()
+        self.db.close()
+        self.db = None
@@ -26,39 +26,117 @@ class COTRouter:
     """
 
     def __init__(self):
-        # TODO: self.clients as dictionary, with UID as keys?
-        #     : should prohibit multiple sockets sharing a client
+        # TODO: should prohibit multiple sockets sharing a client
         self.clients = set()
+        self.peers = set()
+
+        # Identified clients, indexed for directed routing
+        self.by_uid = {}
+        self.by_callsign = {}
+        self.by_group = {}
+        self.index_keys = {}
+
         self.persist = build_persistence()
         self.last_prune = 0
         self.max_ttl = app_config.getint("cot_server", "max_persist_ttl")
+        self.suppress_duplicates = app_config.getboolean(
+            "cot_server", "suppress_duplicates"
+        )
         self.lgr = logging.getLogger(self.__class__.__name__)
 
     def prune(self):
+        self.persist.flush()
+
         now = time.time()
         if (now - self.last_prune) > 10:
             self.last_prune = now
             self.persist.prune()
 
+    def close(self):
+        """
+        Flush and close the persistence store
+        """
+        self.persist.close()
+
     def client_connect(self, client):
         """
         Add a client to the router
         """
         self.clients.add(client)
+        self.update_index(client)
 
     def client_disconnect(self, client):
         """
         Remove a client from the router
         """
         self.clients.discard(client)
+        self.peers.discard(client)
+        self._unindex(client)
+
+    def update_index(self, client):
+        """
+        Make sure the client is indexed under its current uid, callsign, and
+        group.
+
+        TAKClient.handle_atom() updates client.user just before the event is
+        routed, so route() calls this for every source.
+        """
+        if client not in self.clients or client.user is None:
+            return
+
+        keys = (client.user.uid, client.user.callsign, client.user.group)
+        if self.index_keys.get(client) == keys:
+            return
+
+        self._unindex(client)
+        self.index_keys[client] = keys
+        for (index, key) in zip(self._indexes(), keys):
+            index.setdefault(key, set()).add(client)
+
+    def _unindex(self, client):
+        keys = self.index_keys.pop(client, None)
+        if keys is None:
+            return
+
+        for (index, key) in zip(self._indexes(), keys):
+            clients = index.get(key)
+            if clients is None:
+                continue
+            clients.discard(client)
+            if not clients:
+                del index[key]
+
+    def _indexes(self):
+        return (self.by_uid, self.by_callsign, self.by_group)
+
+    def add_peer(self, peer):
+        """
+        Add a link to other taky workers. Events routed from local clients
+        are published to the peer.
+        """
+        self.peers.add(peer)
+
+    @staticmethod
+    def from_peer(src):
+        """
+        Returns True if the source is a link to another taky worker
+        """
+        return isinstance(src, TAKClient) and src.peer
 
     def send_persist(self, client):
         """
         Called by TAKClient when the client first identifies to the server
         """
         self.lgr.debug("Sending persistence objects to %s", client)
+        own_uid = client.user.uid if client.user else None
+
+        # Clients that take raw bytes get the whole store in one append
+        if client.sends_wire:
+            client.send_wire(self.persist.get_all_wire(exclude_uid=own_uid))
+            return
+
         for event in self.persist.get_all():
-            if client.user and event.uid == client.user.uid:
+            if event.uid == own_uid:
                 continue
 
             client.send_event(event)
@@ -67,14 +145,10 @@ class COTRouter:
         """
         Returns an iterator of objects matching the criteria
         """
-        for client in self.clients:
-            if not client.user:
-                continue
-
-            if uid and client.user.uid == uid:
-                yield client
-            if callsign and client.user.callsign == callsign:
-                yield client
+        if uid:
+            yield from tuple(self.by_uid.get(uid, ()))
+        if callsign:
+            yield from tuple(self.by_callsign.get(callsign, ()))
 
     def broadcast(self, src, msg):
         """
@@ -85,8 +159,17 @@ class COTRouter:
         else:
             self.lgr.debug("Anonymous Broadcast: %s", msg)
 
-        self.persist.track(msg)
-        for client in self.clients:
+        # The worker that received the event has already stored it
+        duplicate = self.persist.track(
+            msg, stored=self.from_peer(src) and self.persist.shared
+        )
+
+        # Clients already have a copy of the event that is good for a while
+        if duplicate and self.suppress_duplicates:
+            return
+
+        # A slow client may be disconnected while sending
+        for client in tuple(self.clients):
             if client is src:
                 continue
 
@@ -114,12 +197,11 @@ class COTRouter:
         else:
             self.lgr.debug("Anonymous -> %s: %s", group, msg)
 
-        for client in self.clients:
-            if not client.user or (client.user is src):
+        for client in tuple(self.by_group.get(group, ())):
+            if client.user is src:
                 continue
 
-            if client.user.group == group:
-                client.send_event(msg)
+            client.send_event(msg)
 
     def send_user(self, src, msg, dst_cs=None, dst_uid=None):
         """
@@ -135,14 +217,25 @@ class COTRouter:
         if not isinstance(evt, models.Event):
             raise ValueError(f"Unable to route {type(evt)}")
 
+        if isinstance(src, TAKClient):
+            self.update_index(src)
+
         # If configured, constrain events to a max TTL
         if self.max_ttl >= 0:
             if evt.persist_ttl > self.max_ttl:
                 evt.stale = dt.utcnow() + timedelta(seconds=self.max_ttl)
 
+        # Decode the detail before the event is sent anywhere, in case it
+        # is invalid
+        detail = evt.detail
+
+        if not self.from_peer(src):
+            for peer in self.peers:
+                peer.send_event(evt)
+
         # Special handling for chat messages
-        if isinstance(evt.detail, models.GeoChat):
-            chat = evt.detail
+        if isinstance(detail, models.GeoChat):
+            chat = detail
             if chat.broadcast:
                 self.broadcast(src, evt)
             elif chat.dst_team:
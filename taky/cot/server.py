@@ -1,7 +1,7 @@
 import os
 import time
 import socket
-import select
+import selectors
 import ssl
 import logging
 
@@ -10,9 +10,10 @@ from taky.util import anc
 from .router import COTRouter
 from .client import TAKClient, SocketTAKClient
 from .mgmt import MgmtClient
+from .peer import PeerLink
 
 
-def build_srv(ip_addr, port):
+def build_srv(ip_addr, port, reuse_port=False):
     if ip_addr is None:
         ip_addr = ""
         sock_fam = socket.AF_INET
@@ -30,12 +31,53 @@ def build_srv(ip_addr, port):
 
     sock = socket.socket(sock_fam, socket.SOCK_STREAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        # Let several workers accept connections on the same port
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     sock.bind(bind_args)
-    sock.listen()
+    sock.listen(socket.SOMAXCONN)
 
     return sock
 
 
+def build_ssl_ctx(lgr):
+    """
+    Build the server SSL context from the config. Returns None if SSL is
+    disabled.
+    """
+    if not config.getboolean("ssl", "enabled"):
+        return None
+
+    ssl_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+
+    if config.getboolean("ssl", "client_cert_required"):
+        ssl_ctx.verify_mode = ssl.CERT_REQUIRED
+    else:
+        lgr.info("Clients will not need to present a certificate")
+        ssl_ctx.verify_mode = ssl.CERT_OPTIONAL
+
+    # Load up CA certificates
+    try:
+        ca_cert = config.get("ssl", "ca")
+        if ca_cert:
+            lgr.info("Loading CA certificate from %s", ca_cert)
+            ssl_ctx.load_verify_locations(ca_cert)
+        else:
+            lgr.info("Using default CA certificates")
+            ssl_ctx.load_default_certs()
+
+        ssl_ctx.load_cert_chain(
+            certfile=config.get("ssl", "cert"),
+            keyfile=config.get("ssl", "key"),
+            password=config.get("ssl", "key_pw"),
+        )
+    except (ssl.SSLError, OSError) as exc:
+        lgr.error("Unable to load SSL certificate: %s", exc)
+        raise exc
+
+    return ssl_ctx
+
+
 def check_socket(mgmt_sock_path):
     """Checks if the management socket is available for binding"""
     if not os.path.exists(mgmt_sock_path):
@@ -65,113 +107,197 @@ def ping_socket(mgmt_sock_path):
     return False
 
 
-class COTServer:
+class BaseCOTServer:
     """
-    COTServer is an object which hosts the server socket, handles client
-    sockets, and routes packets between them.
-
-    In the simplest usage, create the object, and call loop()
+    The setup and client handling shared by COTServer and AsyncCOTServer:
+    the listening sockets, and the checks made when a client connects.
     """
 
-    def __init__(self):
+    def __init__(self, worker=None):
         """
-        Construct the COTServer object, and build the server socket
+        @param worker The index of this worker, if running multiple workers
         """
         self.lgr = logging.getLogger(self.__class__.__name__)
+        self.worker = worker
 
         self.clients = {}
         self.router = COTRouter()
         self.cert_db = anc.CertificateDatabase()
 
         self.mgmt = None
-        self.mon = None
-        self.srv = None
         self.ssl_ctx = None
 
         self.started = -1
 
-    def sock_setup(self):
+    @property
+    def mgmt_sock_path(self):
         """
-        Build the server socket
+        The path of the management socket. Each worker has its own.
         """
-        self.started = time.time()
+        name = "taky-mgmt.sock"
+        if self.worker:
+            name = f"taky-mgmt-{self.worker}.sock"
 
-        # Setup the Management Socket
-        mgmt_sock_path = os.path.join(config.get("taky", "root_dir"), "taky-mgmt.sock")
+        return os.path.join(config.get("taky", "root_dir"), name)
+
+    def _ssl_setup(self):
+        """
+        Build the SSL context
+        """
+        return build_ssl_ctx(self.lgr)
+
+    def listen_mgmt(self):
+        """
+        Build the management socket
+
+        @return The listening socket, or None if it could not be opened
+        """
+        mgmt_sock_path = self.mgmt_sock_path
         if not check_socket(mgmt_sock_path):
             raise RuntimeError(
                 f"Taky already appears to be running via {mgmt_sock_path}"
             )
 
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         try:
-            self.mgmt = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-            self.mgmt.bind(mgmt_sock_path)
-            self.mgmt.listen()
+            sock.bind(mgmt_sock_path)
+            sock.listen()
         except OSError as exc:
             self.lgr.error(
                 "Unable to open management socket at %s: %s", mgmt_sock_path, exc
             )
-            self.mgmt = None
+            sock.close()
+            return None
+
+        return sock
+
+    def listen_cot(self):
+        """
+        Build the SSL context, and the server socket
 
-        # Build the SSL Context
+        @return The listening socket
+        """
         self.ssl_ctx = self._ssl_setup()
 
-        # Setup the Server Socket
         ip_addr = config.get("taky", "bind_ip")
         port = config.getint("cot_server", "port")
 
         mode = "ssl" if self.ssl_ctx else "tcp"
         self.lgr.info("Listening for %s on %s:%s", mode, ip_addr or "", port)
-        self.srv = build_srv(ip_addr, port)
+        return build_srv(ip_addr, port, reuse_port=self.worker is not None)
 
-        # Setup the Monitor Socket
-        if mode == "tcp":
-            return
+    def listen_mon(self):
+        """
+        Build the monitor socket, which is only used with SSL
+
+        @return The listening socket, or None if it is not configured
+        """
+        if not self.ssl_ctx:
+            return None
 
         ip_addr = config.get("cot_server", "mon_ip")
         port = config.getint("cot_server", "mon_port")
 
         if ip_addr is None:
-            return
+            return None
 
         self.lgr.info("Monitor listening for tcp on %s:%s", ip_addr, port)
-        self.mon = build_srv(ip_addr, port)
+        return build_srv(ip_addr, port, reuse_port=self.worker is not None)
 
-    def _ssl_setup(self):
+    def client_connect(self, client):
         """
-        Build the SSL context
+        Reject banned clients, and send the persisted events to the rest
         """
-        if not config.getboolean("ssl", "enabled"):
-            return None
+        if client.peer_cert:
+            self.lgr.debug(
+                "Checking %s against cert db", client.peer_cert.get("serialNumber")
+            )
+            cert = self.cert_db.get_certificate_by_serial(
+                client.peer_cert.get("serialNumber")
+            )
+            if cert and cert.get("status") == "R":
+                self.client_disconnect(client, "User banned")
+                return
 
-        ssl_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.router.send_persist(client)
 
-        if config.getboolean("ssl", "client_cert_required"):
-            ssl_ctx.verify_mode = ssl.CERT_REQUIRED
-        else:
-            self.lgr.info("Clients will not need to present a certificate")
-            ssl_ctx.verify_mode = ssl.CERT_OPTIONAL
+    def client_disconnect(self, client, reason=None):
+        """
+        Disconnect a client from the server. Implemented in a subclass.
+        """
+        raise NotImplementedError()
 
-        # Load up CA certificates
-        try:
-            ca_cert = config.get("ssl", "ca")
-            if ca_cert:
-                self.lgr.info("Loading CA certificate from %s", ca_cert)
-                ssl_ctx.load_verify_locations(ca_cert)
-            else:
-                self.lgr.info("Using default CA certificates")
-                ssl_ctx.load_default_certs()
+    def mon_packet(self, evt):
+        # A client may be disconnected while sending
+        for client in list(self.clients.values()):
+            if client.monitor:
+                client.send_event(evt)
+
+
+class COTServer(BaseCOTServer):
+    """
+    COTServer is an object which hosts the server socket, handles client
+    sockets, and routes packets between them.
+
+    In the simplest usage, create the object, and call loop()
+
+    Sockets are registered with a selector (epoll, where available) once,
+    when they are accepted. A client only asks for write readiness while it
+    has data buffered, so an idle client costs nothing per loop iteration.
+    """
+
+    def __init__(self, worker=None, hub_sock=None):
+        """
+        Construct the COTServer object, and build the server socket
+
+        @param worker   The index of this worker, if running multiple workers
+        @param hub_sock The socket connecting this worker to the hub
+        """
+        super().__init__(worker)
+        self.hub_sock = hub_sock
+
+        self.sel = selectors.DefaultSelector()
+        self.tx_pending = set()
+        self.rx_pending = set()
 
-            ssl_ctx.load_cert_chain(
-                certfile=config.get("ssl", "cert"),
-                keyfile=config.get("ssl", "key"),
-                password=config.get("ssl", "key_pw"),
+        self.mon = None
+        self.srv = None
+
+        self.last_sweep = 0
+
+    def sock_setup(self):
+        """
+        Build the server socket
+        """
+        self.started = time.time()
+
+        # Setup the Management Socket
+        self.mgmt = self.listen_mgmt()
+        if self.mgmt:
+            self.sel.register(self.mgmt, selectors.EVENT_READ)
+
+        # Setup the Server Socket
+        self.srv = self.listen_cot()
+        self.sel.register(self.srv, selectors.EVENT_READ)
+
+        # Setup the link to the other workers
+        if self.hub_sock:
+            self.hub_sock.setblocking(False)
+            peer = PeerLink(
+                sock=self.hub_sock,
+                cbs={
+                    "route": self.router.route,
+                    "packet_rx": self.mon_packet,
+                    "tx": self.client_tx,
+                },
             )
-        except (ssl.SSLError, OSError) as exc:
-            self.lgr.error("Unable to load SSL certificate: %s", exc)
-            raise exc
+            if self.add_client(peer):
+                self.router.add_peer(peer)
 
-        return ssl_ctx
+        # Setup the Monitor Socket
+        self.mon = self.listen_mon()
+        if self.mon:
+            self.sel.register(self.mon, selectors.EVENT_READ)
 
     def mgmt_accept(self):
         """
@@ -188,7 +314,11 @@ class COTServer:
             return
 
         self.lgr.info("New management client")
-        self.clients[sock] = MgmtClient(sock=sock, use_ssl=False, server=self)
+        sock.setblocking(False)
+        client = MgmtClient(
+            sock=sock, use_ssl=False, server=self, cbs={"tx": self.client_tx}
+        )
+        self.add_client(client)
 
     def srv_accept(self, srv_sock, force_tcp=False, mon_client=False):
         """
@@ -218,49 +348,105 @@ class COTServer:
         stype = "ssl" if use_ssl else "tcp"
         if mon_client:
             self.lgr.info("New %s mon client from %s:%s", stype, ip_addr, port)
-            self.clients[sock] = SocketTAKClient(
+            client = SocketTAKClient(
                 monitor=True,
                 sock=sock,
                 cbs={
                     "route": self.router.route,
                     "connect": self.client_connect,
+                    "disconnect": self.client_disconnect,
+                    "tx": self.client_tx,
                 },
             )
         else:
             self.lgr.info("New %s cot client from %s:%s", stype, ip_addr, port)
-            self.clients[sock] = SocketTAKClient(
+            client = SocketTAKClient(
                 sock=sock,
                 use_ssl=use_ssl,
                 cbs={
                     "route": self.router.route,
                     "packet_rx": self.mon_packet,
                     "connect": self.client_connect,
+                    "disconnect": self.client_disconnect,
+                    "tx": self.client_tx,
                 },
             )
 
-        self.router.client_connect(self.clients[sock])
+        if self.add_client(client):
+            self.router.client_connect(client)
 
-    def client_connect(self, client):
-        if client.peer_cert:
-            self.lgr.debug(
-                "Checking %s against cert db", client.peer_cert.get("serialNumber")
-            )
-            cert = self.cert_db.get_certificate_by_serial(
-                client.peer_cert.get("serialNumber")
-            )
-            if cert and cert.get("status") == "R":
-                self.client_disconnect(client, "User banned")
-                return
+    def add_client(self, client):
+        """
+        Start tracking a socket client, and register it with the selector.
 
-        self.router.send_persist(client)
+        Returns False if the client could not be registered.
+        """
+        # The connect callback may have already rejected the client
+        if client.is_closed:
+            return False
+
+        # A client closed outside the loop is still registered under its old
+        # descriptor, which the OS may have just handed to this client
+        try:
+            stale = self.sel.get_key(client.sock_fd).data
+        except (KeyError, ValueError):
+            stale = None
+        if stale is not None and stale is not client and stale.is_closed:
+            self.client_disconnect(stale, "Is closed")
+
+        try:
+            self.sel.register(client.sock_fd, self.client_events(client), client)
+        except (KeyError, ValueError, OSError) as exc:
+            self.lgr.warning("Unable to register %s: %s", client, exc)
+            client.disconnect("Registration failed")
+            return False
+
+        self.clients[client.sock] = client
+        return True
+
+    @staticmethod
+    def client_events(client):
+        """
+        Returns the selector events a client is interested in
+        """
+        if client.has_data:
+            return selectors.EVENT_READ | selectors.EVENT_WRITE
+        return selectors.EVENT_READ
+
+    def client_tx(self, client):
+        """
+        Callback from a client that has just queued outgoing data
+        """
+        self.tx_pending.add(client)
+
+    def update_events(self, client):
+        """
+        Update the selector registration for a client, if it has changed
+        """
+        if client.is_closed:
+            return
+
+        events = self.client_events(client)
+        try:
+            key = self.sel.get_key(client.sock_fd)
+            if key.events != events:
+                self.sel.modify(client.sock_fd, events, client)
+        except (KeyError, ValueError):
+            pass
 
     def client_disconnect(self, client, reason=None):
         """
         Disconnect a client from the server
         """
         client.disconnect(reason)
+        self.tx_pending.discard(client)
+        self.rx_pending.discard(client)
         if client.sock in self.clients:
             client = self.clients.pop(client.sock)
+            try:
+                self.sel.unregister(client.sock_fd)
+            except (KeyError, ValueError):
+                pass
 
         if isinstance(client, TAKClient):
             self.router.client_disconnect(client)
@@ -269,53 +455,61 @@ class COTServer:
         """
         Main loop. Call outside this object in a "while True" block.
         """
-        rd_clients = list(self.clients)
-        rd_clients.append(self.srv)
-        if self.mon:
-            rd_clients.append(self.mon)
-        if self.mgmt:
-            rd_clients.append(self.mgmt)
-        wr_clients = list(filter(lambda x: self.clients[x].has_data, self.clients))
-
-        (s_rd, s_wr, s_ex) = select.select(rd_clients, wr_clients, rd_clients, 1)
-
-        # At each stage, we will need to re-check to make sure the previous
-        # stage did not close our socket.
-
-        # Process exception sockets
-        for sock in s_ex:
-            if sock in [self.srv, self.mon, self.mgmt]:
-                raise RuntimeError("Server socket exceptional condition")
-
-            client = self.clients.get(sock)
-            self.client_disconnect(client, "Exceptional condition")
+        # Clients which queued data since the last iteration need to be
+        # watched for write readiness
+        while self.tx_pending:
+            self.update_events(self.tx_pending.pop())
+
+        # Clients that ran out of receive budget last time are served again
+        # without waiting for the selector
+        rx_pending = self.rx_pending
+        self.rx_pending = set()
+        timeout = 0 if rx_pending else 1
+
+        ready = self.sel.select(timeout)
+        ready_fds = {key.fd for (key, _) in ready}
+        for client in rx_pending:
+            if client.sock_fd in ready_fds or client.is_closed:
+                continue
+            ready.append((self.sel.get_key(client.sock_fd), selectors.EVENT_READ))
 
-        # Process sockets with incoming data
-        for sock in s_rd:
+        for (key, events) in ready:
+            sock = key.fileobj
             if sock is self.srv:
                 self.srv_accept(sock)
-            elif sock is self.mon:
+                continue
+            if sock is self.mon:
                 self.srv_accept(sock, mon_client=True)
-            elif sock is self.mgmt:
+                continue
+            if sock is self.mgmt:
                 self.mgmt_accept()
-            else:
-                client = self.clients.get(sock)
-                if client and not client.is_closed:
-                    client.socket_rx()
-
-        # Process sockets with outgoing data
-        for sock in s_wr:
-            client = self.clients.get(sock)
-            if client and not client.is_closed:
+                continue
+
+            # At each stage, we will need to re-check to make sure the
+            # previous stage did not close our socket.
+            client = key.data
+            if events & selectors.EVENT_READ and not client.is_closed:
+                if client.socket_rx():
+                    self.rx_pending.add(client)
+            if events & selectors.EVENT_WRITE and not client.is_closed:
                 client.socket_tx()
 
+            if client.is_closed:
+                self.client_disconnect(client, "Is closed")
+            else:
+                self.update_events(client)
+
         # Prune the persistence database
         self.router.prune()
 
         # Prune sockets that have not finished the SSL handshake
         now = time.time()
-        prune_sox = list(self.clients.items())
-        for (sock, client) in prune_sox:
+        if (now - self.last_sweep) < 1:
+            return
+
+        self.last_sweep = now
+        prune_sox = list(self.clients.values())
+        for client in prune_sox:
             if client.is_closed:
                 self.client_disconnect(client, "Is closed")
                 continue
@@ -351,9 +545,7 @@ class COTServer:
             self.mon = None
 
         if self.mgmt:
-            mgmt_sock_path = os.path.join(
-                config.get("taky", "root_dir"), "taky-mgmt.sock"
-            )
+            mgmt_sock_path = self.mgmt_sock_path
             try:
                 self.mgmt.shutdown(socket.SHUT_RDWR)
             except:  # pylint: disable=bare-except
@@ -368,9 +560,6 @@ class COTServer:
 
             self.mgmt = None
 
+        self.sel.close()
+        self.router.close()
         self.lgr.info("Stopped")
-
-    def mon_packet(self, evt):
-        for client in self.clients.values():
-            if client.monitor:
-                client.send_event(evt)
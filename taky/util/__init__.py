@@ -1,4 +1,7 @@
 from .xmldeclstrip import XMLDeclStrip
+from .eventframer import EventFramer, FramingError
+from .prefixmatch import PrefixMatcher
+from .cottime import parse_cot_time, format_cot_time
 from . import anc
 from . import datapackage
 
@@ -0,0 +1,85 @@
+"""
+Fast parsing and formatting of CoT timestamps.
+
+CoT events carry three timestamps (time, start and stale), which are nearly
+always in the form "YYYY-MM-DDTHH:MM:SS.fffZ". These are parsed with
+datetime.fromisoformat (Python 3.7+), or by slicing the string. Anything
+else is handed to dateutil's isoparse.
+
+Timestamps are returned as naive datetimes. As with isoparse, any timezone
+in the string is dropped, not converted.
+"""
+import functools
+from datetime import datetime
+
+from dateutil.parser import isoparse
+
+# Not available in Python 3.6
+FROMISOFORMAT = getattr(datetime, "fromisoformat", None)
+
+
+def _naive(timestamp):
+    """
+    Drop the timezone of a datetime, without copying a naive one
+    """
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.replace(tzinfo=None)
+
+
+def parse_cot_time(value):
+    """
+    Parse a CoT timestamp into a naive datetime
+
+    @param value The timestamp string, ie: "2021-02-27T20:32:24.771Z"
+    @raise ValueError if the timestamp can not be parsed, or TypeError if
+           value is not a string
+    """
+    if FROMISOFORMAT is not None and value[10:11] == "T":
+        try:
+            if value[-1:] == "Z":
+                return _naive(FROMISOFORMAT(value[:-1]))
+            return _naive(FROMISOFORMAT(value))
+        except ValueError:
+            pass
+
+    if (
+        len(value) >= 19
+        and value[4] == "-"
+        and value[7] == "-"
+        and value[10] == "T"
+        and value[13] == ":"
+        and value[16] == ":"
+    ):
+        frac = value[19:]
+        if frac[-1:] == "Z":
+            frac = frac[:-1]
+
+        digits = value[0:4] + value[5:7] + value[8:10] + value[11:13]
+        digits += value[14:16] + value[17:19] + frac[1:]
+        if (not frac or (frac[0] == "." and 1 < len(frac) <= 7)) and digits.isdigit():
+            try:
+                return datetime(
+                    int(value[0:4]),
+                    int(value[5:7]),
+                    int(value[8:10]),
+                    int(value[11:13]),
+                    int(value[14:16]),
+                    int(value[17:19]),
+                    int(frac[1:].ljust(6, "0")) if frac else 0,
+                )
+            except ValueError:
+                pass
+
+    return _naive(isoparse(value))
+
+
+@functools.lru_cache(maxsize=1024)
+def format_cot_time(timestamp):
+    """
+    Format a naive datetime as a CoT timestamp, ie: "2021-02-27T20:32:24.771Z"
+
+    The results are cached, since an event's time and start are usually the
+    same, and the same event is often formatted more than once.
+    """
+    return timestamp.isoformat(timespec="milliseconds") + "Z"
@@ -0,0 +1,234 @@
+import re
+
+# A start, end, or empty element tag. Quoted attribute values may hold ">".
+# (The attributes are matched as runs of unquoted text between quoted
+# values, so a partial tag fails without backtracking into the runs.)
+TAG = re.compile(rb"""<(/?)([^\s/>"']+)([^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>""")
+# The start of a tag, up to the end of its name
+TAG_NAME = re.compile(rb"""<(/?)([^\s/>"']+)""")
+
+# Incomplete elements up to this size are searched for their end tag again
+# after each read
+FAST_MAX = 16384
+
+# Markup which is skipped over, as (opener, closer)
+SKIPPED = [
+    (b"<?", b"?>"),
+    (b"<!--", b"-->"),
+    (b"<![CDATA[", b"]]>"),
+]
+
+OPEN = 0
+CLOSE = 1
+EMPTY = 2
+OTHER = 3
+
+
+class FramingError(ValueError):
+    """
+    Raised when a stream can not be split into elements
+    """
+
+
+class EventFramer:
+    """
+    Split a stream of XML documents into its top level elements.
+
+    Data is appended to a single buffer, and scanned from a cursor, so the
+    stream is not copied or rescanned as it arrives, beyond the element
+    being framed.
+    read_frames() yields the bytes of each complete top level element, which
+    can be parsed on its own, or forwarded as-is.
+
+    Only the markup is tracked: the depth of the start and end tags, with
+    quoted attribute values, comments, CDATA, and processing instructions
+    skipped over. XML declarations, comments, and text between elements are
+    discarded. The frames are not checked for well formedness, that is left
+    to the parser.
+
+    As "<" can't appear in attribute values, an element with no comments,
+    CDATA, processing instructions, or nested elements of the same name ends
+    at the first end tag with its name. Small elements are checked for this
+    with a few searches of the buffer, before falling back to walking their
+    tags one by one.
+    """
+
+    def __init__(self, max_size=1048576):
+        """
+        @param max_size The largest element accepted, in bytes
+        """
+        self.max_size = max_size
+
+        self.buf = bytearray()
+        # Where to resume scanning
+        self.pos = 0
+        # The offset and name of the element being framed, if any
+        self.start = None
+        self.name = None
+        self.depth = 0
+        # Try to find the end of the element with _fast_end()
+        self.fast = False
+        # Matches the markup _fast_end() looks for, for elements named end_name
+        self.end_name = None
+        self.end_re = None
+
+    def feed(self, data):
+        self.buf += data
+
+    def read_frames(self):
+        """
+        Yield the complete top level elements in the buffer, as bytes
+
+        @raise FramingError The stream has an unmatched end tag, or an
+                            element larger than max_size
+        """
+        buf = self.buf
+
+        try:
+            while True:
+                if self.fast:
+                    end = self._fast_end()
+                    if end is None:
+                        break
+                    if end >= 0:
+                        (start, self.start) = (self.start, None)
+                        (self.pos, self.depth, self.fast) = (end, 0, False)
+                        yield self._frame(start, end)
+                        continue
+                    self.fast = False
+
+                pos = buf.find(b"<", self.pos)
+                if pos < 0:
+                    # Only text left, which is discarded between elements
+                    self.pos = len(buf)
+                    break
+
+                self.pos = pos
+                (end, kind, name) = self._token(pos)
+                if end is None:
+                    break
+                self.pos = end
+
+                if kind == OPEN:
+                    if self.depth == 0:
+                        (self.start, self.name, self.fast) = (pos, name, True)
+                    self.depth += 1
+                elif kind == CLOSE:
+                    if self.depth == 0:
+                        raise FramingError("Unmatched end tag")
+                    self.depth -= 1
+                    if self.depth == 0:
+                        (start, self.start) = (self.start, None)
+                        yield self._frame(start, end)
+                elif kind == EMPTY and self.depth == 0:
+                    yield self._frame(pos, end)
+
+            # Don't wait forever for the end of an element
+            pending = self.start if self.start is not None else self.pos
+            if len(buf) - pending > self.max_size:
+                raise FramingError("Element exceeds %d bytes" % self.max_size)
+        finally:
+            self._compact()
+
+    def _frame(self, start, end):
+        if end - start > self.max_size:
+            raise FramingError("Element exceeds %d bytes" % self.max_size)
+
+        return bytes(self.buf[start:end])
+
+    def _fast_end(self):
+        """
+        Find the end of the element being framed, if it is small and only
+        holds plain elements and text. self.pos is the end of its start tag.
+
+        @return The end offset, None if more data is needed, or -1 if the
+                element must be framed by _token()
+        """
+        if self.name != self.end_name:
+            name = re.escape(self.name)
+            self.end_name = self.name
+            self.end_re = re.compile(rb"<[!?]|<" + name + rb"|</" + name + rb"\s*>")
+
+        match = self.end_re.search(self.buf, self.pos)
+        if match is None:
+            if len(self.buf) - self.start > FAST_MAX:
+                # Don't search a large element again for every read
+                return -1
+            return None
+
+        if not match.group().startswith(b"</"):
+            # A comment, CDATA, processing instruction, or a nested element
+            # which may have the same name
+            return -1
+
+        return match.end()
+
+    def _token(self, pos):
+        """
+        Find the end of the markup at pos
+
+        @return (end, kind, name), or (None, None, None) if more data is
+                needed. name is only set for element tags.
+        """
+        buf = self.buf
+        if pos + 1 >= len(buf):
+            return (None, None, None)
+
+        if buf[pos + 1] in b"?!":
+            for (opener, closer) in SKIPPED:
+                head = bytes(buf[pos : pos + len(opener)])
+                if head == opener:
+                    end = buf.find(closer, pos + len(opener))
+                    if end < 0:
+                        return (None, None, None)
+                    return (end + len(closer), OTHER, None)
+                if opener.startswith(head):
+                    # Too short to tell which it is
+                    return (None, None, None)
+
+            # A DOCTYPE, or other declaration
+            end = buf.find(b">", pos)
+            if end < 0:
+                return (None, None, None)
+            return (end + 1, OTHER, None)
+
+        # Most partial tags are missing their ">"
+        end = buf.find(b">", pos)
+        if end < 0:
+            return (None, None, None)
+
+        match = TAG_NAME.match(buf, pos)
+        if match is None:
+            raise FramingError("Invalid tag at offset %d" % pos)
+
+        # The first ">" ends the tag, unless it is in a quoted value. Counting
+        # the quotes rules that out if only one kind is used.
+        dquotes = buf.count(b'"', pos, end)
+        squotes = buf.count(b"'", pos, end)
+        if (squotes or dquotes % 2) and (dquotes or squotes % 2):
+            match = TAG.match(buf, pos)
+            if match is None:
+                # An unterminated attribute value
+                return (None, None, None)
+            end = match.end()
+        else:
+            end += 1
+
+        if match.group(1):
+            return (end, CLOSE, match.group(2))
+        if buf[end - 2] == ord("/"):
+            return (end, EMPTY, match.group(2))
+        return (end, OPEN, match.group(2))
+
+    def _compact(self):
+        """
+        Drop the consumed part of the buffer
+        """
+        keep = self.start if self.start is not None else self.pos
+        if keep == 0:
+            return
+
+        del self.buf[:keep]
+        self.pos -= keep
+        if self.start is not None:
+            self.start -= keep
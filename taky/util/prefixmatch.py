@@ -0,0 +1,47 @@
+import re
+
+
+class PrefixMatcher:
+    """
+    Matches strings, such as CoT event types, against a list of prefixes.
+
+    The prefixes are compiled into a single regex, and the result for each
+    string is cached, since a server sees the same few types over and over.
+    The cache is cleared if it grows past cache_size entries.
+
+    Usage:
+      matcher = PrefixMatcher(["a-", "b-m-p"])
+      matcher.match("a-f-G-U-C")  # True
+    """
+
+    def __init__(self, prefixes, cache_size=4096):
+        self.prefixes = tuple(prefixes)
+        self.cache = {}
+        self.cache_size = cache_size
+
+        if self.prefixes:
+            # Longest first, so the alternation does not depend on list order
+            ordered = sorted(set(self.prefixes), key=len, reverse=True)
+            self.regex = re.compile("|".join(re.escape(pfx) for pfx in ordered))
+        else:
+            self.regex = None
+
+    def __repr__(self):
+        return f"<PrefixMatcher prefixes={self.prefixes}>"
+
+    def match(self, value):
+        """
+        Returns True if value starts with any of the prefixes
+        """
+        try:
+            return self.cache[value]
+        except KeyError:
+            pass
+
+        ret = self.regex is not None and self.regex.match(value) is not None
+
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[value] = ret
+
+        return ret
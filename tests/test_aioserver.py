@@ -0,0 +1,119 @@
+import os
+import socket
+import asyncio
+import tempfile
+import unittest as ut
+from unittest import mock
+from datetime import datetime as dt
+from datetime import timedelta
+
+from lxml import etree
+
+from taky.config import load_config, app_config
+from taky.cot import AsyncCOTServer
+from . import XML_S
+
+
+class AsyncCOTServerTestcase(ut.TestCase):
+    def setUp(self):
+        load_config(os.devnull)
+        self.tmp = tempfile.TemporaryDirectory()
+        app_config.set("taky", "redis", "false")
+        app_config.set("taky", "root_dir", self.tmp.name)
+        app_config.set("taky", "bind_ip", "127.0.0.1")
+        app_config.set("cot_server", "port", "0")
+        app_config.set("cot_server", "mode", "asyncio")
+        app_config.set("cot_server", "log_cot", None)
+
+        self.server = AsyncCOTServer()
+        self.server.sock_setup()
+        self.addr = self.server.servers[-1].sockets[0].getsockname()
+        self.socks = []
+
+        # An event which is persisted until tomorrow
+        elm = etree.fromstring(XML_S)
+        now = dt.utcnow()
+        elm.set("time", now.isoformat() + "Z")
+        elm.set("start", now.isoformat() + "Z")
+        elm.set("stale", (now + timedelta(days=1)).isoformat() + "Z")
+        self.event = etree.tostring(elm)
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        self.server.shutdown()
+        self.tmp.cleanup()
+
+    def run_until(self, cond, tries=50):
+        for _ in range(tries):
+            self.server.aio.run_until_complete(asyncio.sleep(0.01))
+            if cond():
+                return
+        self.fail("Condition not met")
+
+    def connect(self):
+        """
+        Connect to the server, and run the loop until the client is served
+        """
+        sock = socket.create_connection(self.addr, timeout=2)
+        sock.setblocking(False)
+        self.socks.append(sock)
+        count = len(self.server.clients)
+        self.run_until(lambda: len(self.server.clients) > count)
+        return sock
+
+    def receive(self, sock):
+        """
+        Run the loop until the socket has received a whole event
+        """
+        data = bytearray()
+
+        def received():
+            try:
+                data.extend(sock.recv(65536))
+            except BlockingIOError:
+                pass
+            return b"</event>" in data
+
+        self.run_until(received)
+        return bytes(data)
+
+    def test_route(self):
+        sock1 = self.connect()
+        sock2 = self.connect()
+
+        sock1.sendall(self.event)
+        self.assertIn(b'uid="ANDROID-deadbeef"', self.receive(sock2))
+        users = [client.user for client in self.server.clients.values()]
+        self.assertEqual(len([user for user in users if user]), 1)
+
+    def test_replay(self):
+        sock1 = self.connect()
+        sock1.sendall(self.event)
+        self.run_until(lambda: len(self.server.router.persist.get_all()) == 1)
+
+        # A new client gets the persisted event when it connects
+        sock2 = self.connect()
+        self.assertIn(b'uid="ANDROID-deadbeef"', self.receive(sock2))
+
+    def test_disconnect(self):
+        sock = self.connect()
+        self.assertEqual(len(self.server.router.clients), 1)
+
+        sock.close()
+        self.run_until(lambda: not self.server.clients)
+        self.assertEqual(len(self.server.router.clients), 0)
+
+    def test_syntax_error(self):
+        sock = self.connect()
+        sock.sendall(b"<event><point></event>")
+        self.run_until(lambda: not self.server.clients)
+
+    def test_python_version(self):
+        path = os.path.join(self.tmp.name, "taky.conf")
+        with open(path, "w", encoding="utf8") as cfg_fp:
+            cfg_fp.write("[cot_server]\nmode=asyncio\n")
+
+        with mock.patch("taky.config.sys.version_info", (3, 6, 9)):
+            with self.assertRaises(ValueError):
+                load_config(path)
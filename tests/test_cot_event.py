@@ -1,9 +1,10 @@
 import unittest as ut
+from datetime import timedelta
 
 from lxml import etree
 
 from taky.cot import models
-from . import elements_equal, XML_S
+from . import elements_equal, XML_S, XML_EMPTY_MARTI_BC
 
 
 class COTTestcase(ut.TestCase):
@@ -64,3 +65,37 @@ class COTTestcase(ut.TestCase):
         del self.elm[1]
         evt = models.Event.from_elm(self.elm)
         self.assertTrue(evt.detail is None)
+
+    def test_as_bytes_cached(self):
+        event = models.Event.from_elm(self.elm)
+
+        wire = event.as_bytes
+        self.assertIs(wire, event.as_bytes)
+        self.assertTrue(elements_equal(etree.fromstring(XML_S), etree.fromstring(wire)))
+
+        # Changing a field should rebuild the serialized event
+        event.stale = event.stale + timedelta(seconds=10)
+        self.assertIsNot(wire, event.as_bytes)
+        self.assertIn(b'stale="2021-02-27T20:38:49.771Z"', event.as_bytes)
+
+        # Other fields are only picked up after invalidate()
+        event.etype = "a-h-G"
+        self.assertIn(b'type="a-f-G-U-C"', event.as_bytes)
+        event.invalidate()
+        self.assertIn(b'type="a-h-G"', event.as_bytes)
+
+    def test_marti_scan(self):
+        elm = etree.fromstring(XML_EMPTY_MARTI_BC)
+        event = models.Event.from_elm(elm)
+        self.assertFalse(event.detail.has_marti)
+
+        marti = elm.find("detail/marti")
+        etree.SubElement(marti, "dest", callsign="JENNY")
+        etree.SubElement(marti, "dest", callsign="JOKER")
+        event = models.Event.from_elm(elm)
+
+        # The detail is scanned once, when the event is built
+        scan = event.detail.scan
+        self.assertTrue(event.detail.has_marti)
+        self.assertEqual(event.detail.marti_cs, ("JENNY", "JOKER"))
+        self.assertIs(event.detail.scan, scan)
@@ -0,0 +1,60 @@
+import unittest as ut
+from unittest import mock
+from datetime import datetime as dt
+
+from dateutil.parser import isoparse
+
+from taky.util import parse_cot_time, format_cot_time
+
+
+class COTTimeTestcase(ut.TestCase):
+    def test_parse(self):
+        for (value, expected) in [
+            ("2021-02-27T20:32:24.771Z", dt(2021, 2, 27, 20, 32, 24, 771000)),
+            ("2021-02-27T20:32:24Z", dt(2021, 2, 27, 20, 32, 24)),
+            ("2021-02-27T20:32:24.5Z", dt(2021, 2, 27, 20, 32, 24, 500000)),
+            ("2021-02-27T20:32:24.123456", dt(2021, 2, 27, 20, 32, 24, 123456)),
+            ("2021-02-27T20:32:24", dt(2021, 2, 27, 20, 32, 24)),
+        ]:
+            self.assertEqual(parse_cot_time(value), expected)
+
+    def test_parse_sliced(self):
+        # Python 3.6 has no datetime.fromisoformat
+        with mock.patch("taky.util.cottime.FROMISOFORMAT", None):
+            self.test_parse()
+            self.test_fallback()
+            self.test_invalid()
+
+    def test_fallback(self):
+        # Anything off the fast path should match dateutil
+        for value in [
+            "2021-02-27T20:32:24.771+05:00",
+            "2021-02-27T20:32:24.771-0000",
+            "20210227T203224Z",
+            "2021-02-27",
+        ]:
+            self.assertEqual(
+                parse_cot_time(value), isoparse(value).replace(tzinfo=None)
+            )
+            self.assertIsNone(parse_cot_time(value).tzinfo)
+
+    def test_invalid(self):
+        for value in [
+            "2021-02-30T20:32:24Z",
+            "2021-02-27T20:32:2xZ",
+            "2021-02-27T20:32:24.Z",
+            "garbage",
+            "",
+        ]:
+            with self.assertRaises(ValueError):
+                parse_cot_time(value)
+
+        with self.assertRaises(TypeError):
+            parse_cot_time(None)
+
+    def test_format(self):
+        ts = dt(2021, 2, 27, 20, 32, 24, 771999)
+        self.assertEqual(format_cot_time(ts), "2021-02-27T20:32:24.771Z")
+        self.assertEqual(
+            parse_cot_time(format_cot_time(ts)), ts.replace(microsecond=771000)
+        )
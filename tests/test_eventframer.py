@@ -0,0 +1,127 @@
+import random
+import unittest as ut
+
+from lxml import etree
+
+from taky.util import EventFramer, FramingError, XMLDeclStrip
+from . import XML_S, XML_EMPTY_MARTI_BC
+
+DECL = b"<?xml version='1.0' encoding='utf-8'?>"
+
+
+class EventFramerTest(ut.TestCase):
+    def setUp(self):
+        self.framer = EventFramer(max_size=4096)
+
+    def frames(self, *chunks):
+        ret = []
+        for chunk in chunks:
+            self.framer.feed(chunk)
+            ret.extend(self.framer.read_frames())
+        return ret
+
+    def test_valid_xml(self):
+        frames = self.frames(DECL, b'<event data="stuff here" />')
+        self.assertEqual(frames, [b'<event data="stuff here" />'])
+
+    def test_split_decl(self):
+        frames = self.frames(DECL[:4], DECL[4:], b'<event data="stuff here" />')
+        self.assertEqual(len(frames), 1)
+
+        frames = self.frames(DECL[:-1], DECL[-1:], b'<event data="stuff here" />')
+        self.assertEqual(len(frames), 1)
+
+    def test_split_data(self):
+        frames = self.frames(
+            DECL + b'<event data="stuff here" /><',
+            b'?xml version="1.0"?><event data="stu',
+            b'ff here"><point/></event',
+            b">",
+        )
+        self.assertEqual(
+            frames,
+            [
+                b'<event data="stuff here" />',
+                b'<event data="stuff here"><point/></event>',
+            ],
+        )
+
+    def test_markup_in_content(self):
+        # None of these close the event
+        evt = (
+            b"<event a=\"/>\" b='a>b'><!-- </event> -->"
+            b"<remarks><![CDATA[</event>]]></remarks></event >"
+        )
+        frames = self.frames(evt)
+        self.assertEqual(frames, [evt])
+        self.assertEqual(etree.fromstring(frames[0]).get("b"), "a>b")
+
+        # Nested elements with the same name
+        evt = b"<event><event><event/></event></event>"
+        self.assertEqual(self.frames(evt[:20], evt[20:]), [evt])
+
+    def test_buffer_compacted(self):
+        self.frames(b"junk " + XML_S + b"<event>", b"<point/>")
+        self.assertEqual(bytes(self.framer.buf), b"<event><point/>")
+
+    def test_unmatched_end(self):
+        with self.assertRaises(FramingError):
+            self.frames(b"<event/></event>")
+
+    def test_invalid_tag(self):
+        with self.assertRaises(FramingError):
+            self.frames(b"< event/>")
+
+    def test_max_size(self):
+        with self.assertRaises(FramingError):
+            self.frames(b"<event>", b"<detail/>" * 1000)
+
+        self.framer = EventFramer(max_size=4096)
+        with self.assertRaises(FramingError):
+            self.frames(b'<event a="' + b"x" * 5000 + b'"/>')
+
+    def test_fuzz(self):
+        """
+        The framer and XMLDeclStrip find the same events, however the stream
+        is split up
+        """
+        rnd = random.Random(1234)
+        docs = [
+            XML_S,
+            XML_EMPTY_MARTI_BC.strip(),
+            b'<event uid="x" />',
+            b"<event uid='a>b' how=\"it's\"><detail/></event>",
+            b"<event><!-- </event> --><remarks><![CDATA[</event>]]></remarks>"
+            b"<?pi </event> ?><point/></event>",
+        ]
+        stream = b"".join(DECL + rnd.choice(docs) + b"\n" for _ in range(200))
+
+        expected = None
+        for _ in range(20):
+            cuts = sorted(rnd.sample(range(1, len(stream)), 300))
+            chunks = [stream[i:j] for (i, j) in zip([0] + cuts, cuts + [None])]
+
+            parser = etree.XMLPullParser(tag="event")
+            parser.feed(b"<root>")
+            xdc = XMLDeclStrip(parser)
+            self.framer = EventFramer()
+
+            old = []
+            new = []
+            for chunk in chunks:
+                xdc.feed(chunk)
+                old.extend(
+                    etree.tostring(elm, with_tail=False)
+                    for (_, elm) in xdc.read_events()
+                )
+                self.framer.feed(chunk)
+                new.extend(
+                    etree.tostring(etree.fromstring(frame))
+                    for frame in self.framer.read_frames()
+                )
+
+            self.assertEqual(len(new), 200)
+            self.assertEqual(new, old)
+            if expected is not None:
+                self.assertEqual(new, expected)
+            expected = new
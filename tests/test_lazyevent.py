@@ -0,0 +1,89 @@
+import unittest as ut
+
+from lxml import etree
+
+from taky.cot import models
+from taky.cot.models import lazyevent
+from . import elements_equal, XML_S
+
+
+class LazyEventTestcase(ut.TestCase):
+    def setUp(self):
+        self.elm = etree.fromstring(XML_S)
+
+    def test_equivalent(self):
+        # Details may hand out their source element, so don't share it
+        event = models.Event.from_elm(etree.fromstring(XML_S))
+        lazy = models.LazyEvent.from_elm(self.elm)
+
+        self.assertEqual(lazy.uid, event.uid)
+        self.assertEqual(lazy.etype, event.etype)
+        self.assertEqual(lazy.time, event.time)
+        self.assertEqual(lazy.stale, event.stale)
+        self.assertEqual(lazy.point.coords, event.point.coords)
+        self.assertIsInstance(lazy.detail, models.TAKUser)
+        self.assertEqual(lazy.detail.callsign, "JENNY")
+        self.assertTrue(elements_equal(lazy.as_element, event.as_element))
+
+    def test_lazy(self):
+        lazy = models.LazyEvent.from_elm(self.elm, wire=XML_S)
+        self.assertEqual(set(lazy._fields), {"time", "start", "stale", "point"})
+
+        # The source element may be cleared once the event is built
+        self.elm.clear()
+        self.assertEqual(lazy.detail.callsign, "JENNY")
+        self.assertIn("detail", lazy._fields)
+        self.assertEqual(lazy.as_bytes, XML_S)
+
+        # Changing a field drops the cached XML
+        lazy.stale = lazy.time
+        self.assertNotEqual(lazy.as_bytes, XML_S)
+
+    def test_malformed_time(self):
+        self.elm.set("stale", "garbage")
+        with self.assertRaises(models.UnmarshalError):
+            models.LazyEvent.from_elm(self.elm)
+
+    def test_malformed_point(self):
+        self.elm.find("point").set("lat", "north")
+        with self.assertRaises(models.UnmarshalError):
+            models.LazyEvent.from_elm(self.elm)
+
+    def test_unmarshal_on_access(self):
+        self.elm.find("detail/track").set("speed", "fast")
+        lazy = models.LazyEvent.from_elm(self.elm)
+
+        with self.assertRaises(models.UnmarshalError):
+            lazy.detail
+        # Still raises on later access
+        with self.assertRaises(models.UnmarshalError):
+            lazy.detail
+
+        self.elm.attrib.pop("uid")
+        with self.assertRaises(models.UnmarshalError):
+            models.LazyEvent.from_elm(self.elm)
+
+    def test_compact(self):
+        event = models.Event.from_elm(self.elm)
+        compact = models.LazyEvent.compact(event)
+
+        self.assertFalse(hasattr(compact, "__dict__"))
+        self.assertEqual(compact.as_bytes, event.as_bytes)
+        self.assertEqual(compact.stale, event.stale)
+        self.assertIsNone(compact._elms)
+
+        # The point and detail are parsed from the XML when used
+        self.assertEqual(compact.point.coords, event.point.coords)
+        self.assertEqual(compact.detail.callsign, "JENNY")
+        self.assertIsNone(compact._src)
+
+    def test_compact_entities(self):
+        compact = models.LazyEvent.compact(models.Event.from_elm(self.elm))
+        compact._src = (
+            b'<!DOCTYPE event [<!ENTITY x "expanded">]>'
+            b"<event><detail><remarks>&x;</remarks></detail></event>"
+        )
+
+        # Entities are not expanded when the stored XML is parsed again
+        detail = lazyevent._child(compact, "detail")
+        self.assertIsNone(detail.find("remarks").text)
@@ -40,7 +40,7 @@ class RouterMaxTTLTestcase(ut.TestCase):
 
         self.tk1_ident_msg = etree.tostring(elm)
 
-    @mock.patch("taky.cot.persistence.dt")
+    @mock.patch("taky.cot.persistence.memstore.dt")
     @mock.patch("taky.cot.models.event.dt")
     @mock.patch("taky.cot.router.dt")
     def test_max_ttl(self, mock_dt1, mock_dt2, mock_dt3):
@@ -59,3 +59,20 @@ class RouterMaxTTLTestcase(ut.TestCase):
         ret = self.tk2.queue.get_nowait()
         self.assertTrue(ret.uid == "ANDROID-deadbeef")
         self.assertTrue(ret.persist_ttl == self.max_ttl_s)
+
+    @mock.patch("taky.cot.persistence.memstore.dt")
+    @mock.patch("taky.cot.models.event.dt")
+    @mock.patch("taky.cot.router.dt")
+    def test_max_ttl_rewrites(self, mock_dt1, mock_dt2, mock_dt3):
+        mock_dt1.utcnow = mock.Mock(return_value=self.now)
+        mock_dt2.utcnow = mock.Mock(return_value=self.now)
+        mock_dt3.utcnow = mock.Mock(return_value=self.now)
+
+        self.router.client_connect(self.tk1)
+        self.router.client_connect(self.tk2)
+        self.tk1.feed(self.tk1_ident_msg)
+
+        # The clamped stale time must be sent, not the original XML
+        ret = self.tk2.queue.get_nowait()
+        elm = etree.fromstring(ret.as_bytes)
+        self.assertEqual(elm.get("stale"), "2022-01-01T00:00:10.000Z")
@@ -0,0 +1,65 @@
+import zlib
+import unittest as ut
+
+from lxml import etree
+
+from taky.cot import models
+from taky.cot.models import packed
+from . import elements_equal, XML_S
+
+
+class PackedTestcase(ut.TestCase):
+    def setUp(self):
+        self.event = models.Event.from_elm(etree.fromstring(XML_S))
+
+    def test_round_trip(self):
+        record = packed.pack_event(self.event)
+        self.assertTrue(packed.is_packed(record))
+        self.assertFalse(packed.is_packed(XML_S))
+        self.assertLess(len(record), len(XML_S))
+        self.assertEqual(packed.packed_xml_size(record), len(self.event.as_bytes))
+        self.assertEqual(packed.packed_stale(record), self.event.stale)
+
+        event = packed.unpack_event(record)
+        self.assertEqual(event.uid, self.event.uid)
+        self.assertEqual(event.time, self.event.time)
+        self.assertIsInstance(event.detail, models.TAKUser)
+        self.assertEqual(event.detail.callsign, "JENNY")
+        self.assertTrue(elements_equal(event.as_element, self.event.as_element))
+
+    def test_unpack_wire(self):
+        self.event.uid = 'A&"<B>'
+        record = packed.pack_event(self.event)
+
+        # Built without lxml, but must match the serialized event
+        self.assertEqual(
+            packed.unpack_wire(record), etree.tostring(self.event.as_element)
+        )
+
+    def test_no_detail(self):
+        self.event.detail = None
+        record = packed.pack_event(self.event)
+
+        self.assertIsNone(packed.unpack_event(record).detail)
+        self.assertEqual(
+            packed.unpack_wire(record), etree.tostring(self.event.as_element)
+        )
+
+    def test_corrupt(self):
+        record = packed.pack_event(self.event)
+
+        for data in [record[:20], record[:-10], b"TK\x09" + record[3:]]:
+            with self.assertRaises(models.UnmarshalError):
+                packed.unpack_event(data)
+
+    def test_entities(self):
+        record = packed.pack_event(self.event)
+        (_, _, detail) = packed._unpack(record)
+        record = record[: -len(detail)] + zlib.compress(
+            b'<!DOCTYPE detail [<!ENTITY x "expanded">]>'
+            b"<detail><remarks>&x;</remarks></detail>"
+        )
+
+        # Entities in the stored detail are not expanded
+        detail = packed.unpack_event(record).detail.as_element
+        self.assertIsNone(detail.find("remarks").text)
@@ -0,0 +1,116 @@
+import os
+import socket
+import unittest as ut
+
+from taky import cot
+from taky.config import load_config, app_config
+from taky.cot.peer import FrameBuffer, Hub, FRAME_HDR
+from . import XML_S, UnittestTAKClient
+
+
+class FrameBufferTest(ut.TestCase):
+    def test_split_frames(self):
+        frames = FRAME_HDR.pack(3) + b"abc" + FRAME_HDR.pack(2) + b"de"
+        fbuf = FrameBuffer()
+
+        self.assertEqual(fbuf.feed(frames[:5]), [])
+        self.assertEqual(fbuf.feed(frames[5:9]), [FRAME_HDR.pack(3) + b"abc"])
+        self.assertEqual(fbuf.feed(frames[9:]), [FRAME_HDR.pack(2) + b"de"])
+
+
+class PeerRouteTest(ut.TestCase):
+    def setUp(self):
+        load_config(os.devnull)
+        app_config.set("taky", "redis", "false")
+        app_config.set("cot_server", "log_cot", None)
+        self.router = cot.COTRouter()
+
+        self.peer = UnittestTAKClient(cbs={"route": self.router.route})
+        self.peer.peer = True
+        self.peer.handle_atom = lambda evt: None
+        self.router.add_peer(self.peer)
+
+        self.tk1 = UnittestTAKClient(cbs={"route": self.router.route})
+        self.tk2 = UnittestTAKClient(cbs={"route": self.router.route})
+        self.router.client_connect(self.tk1)
+        self.router.client_connect(self.tk2)
+
+    def test_publish_local(self):
+        self.tk1.feed(XML_S)
+
+        self.assertEqual(self.peer.queue.qsize(), 1)
+        self.assertEqual(self.tk2.queue.qsize(), 1)
+
+    def test_deliver_peer(self):
+        self.peer.feed(XML_S)
+
+        # Delivered to local clients, but not sent back to the other workers
+        self.assertEqual(self.peer.queue.qsize(), 0)
+        self.assertEqual(self.tk1.queue.qsize(), 1)
+        self.assertEqual(self.tk2.queue.qsize(), 1)
+
+
+class HubTest(ut.TestCase):
+    def setUp(self):
+        load_config(os.devnull)
+        self.hub = Hub()
+        self.workers = []
+        for _ in range(2):
+            (hub_sock, worker_sock) = socket.socketpair()
+            worker_sock.setblocking(False)
+            self.hub.add_worker(hub_sock)
+            self.workers.append(worker_sock)
+
+    def tearDown(self):
+        self.hub.close()
+        for sock in self.workers:
+            sock.close()
+
+    @staticmethod
+    def frame(data):
+        return FRAME_HDR.pack(len(data)) + data
+
+    def test_relay(self):
+        (sock1, sock2) = self.workers
+        sock1.sendall(self.frame(XML_S))
+
+        data = bytearray()
+        for _ in range(20):
+            self.assertTrue(self.hub.loop())
+            try:
+                data.extend(sock2.recv(65536))
+            except BlockingIOError:
+                pass
+            if len(data) >= len(self.frame(XML_S)):
+                break
+
+        # Relayed to the other worker, but not back to the sender
+        self.assertEqual(bytes(data), self.frame(XML_S))
+        self.assertRaises(BlockingIOError, sock1.recv, 65536)
+
+    def test_high_water(self):
+        (src, dst) = self.hub.links
+        dst.tx_high_water = 1000
+        dst.tx_low_water = 500
+
+        # The worker is not reading, so frames are dropped once it falls behind
+        for _ in range(10):
+            self.hub.relay(src, self.frame(XML_S))
+        self.assertTrue(dst.tx_congested)
+        self.assertLess(dst.out_len, 1000 + len(self.frame(XML_S)))
+        self.assertGreater(dst.tx_dropped, 0)
+
+        # Until the queue drains
+        dst.socket_tx()
+        self.hub.relay(src, self.frame(XML_S))
+        self.assertFalse(dst.tx_congested)
+
+    def test_high_water_disconnect(self):
+        (src, dst) = self.hub.links
+        dst.tx_high_water = 1000
+        dst.tx_policy = "disconnect"
+
+        for _ in range(10):
+            self.hub.relay(src, self.frame(XML_S))
+        self.assertTrue(dst.is_closed)
+        self.assertFalse(self.hub.loop())
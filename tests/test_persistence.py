@@ -0,0 +1,224 @@
+import os
+import tempfile
+import unittest as ut
+from unittest import mock
+from datetime import datetime as dt
+from datetime import timedelta
+
+from lxml import etree
+
+from taky.config import load_config, app_config
+from taky.cot import models
+from taky.cot.persistence import Persistence, SqlitePersistence
+from . import XML_S
+
+
+class PersistenceTestcase(ut.TestCase):
+    def setUp(self):
+        load_config(os.devnull)
+        self.now = dt(2022, 1, 1)
+        self.persist = Persistence()
+
+    def event(self, uid, stale_s):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        evt.uid = uid
+        evt.etype = "a-u-G"
+        evt.stale = self.now + timedelta(seconds=stale_s)
+        return evt
+
+    @mock.patch("taky.cot.persistence.memstore.dt")
+    @mock.patch("taky.cot.models.event.dt")
+    def test_prune(self, mock_dt1, mock_dt2):
+        mock_dt1.utcnow = mock.Mock(return_value=self.now)
+        mock_dt2.utcnow = mock.Mock(return_value=self.now)
+
+        self.persist.track(self.event("a", 10))
+        self.persist.track(self.event("b", 20))
+        self.persist.track(self.event("c", 30))
+        # The update for "a" outlives its first stale time
+        self.persist.track(self.event("a", 40))
+        self.assertEqual(len(self.persist.get_all()), 3)
+
+        mock_dt2.utcnow.return_value = self.now + timedelta(seconds=25)
+        self.assertEqual({evt.uid for evt in self.persist.get_all()}, {"a", "c"})
+        self.assertIsNotNone(self.persist.get_event("a"))
+
+        mock_dt2.utcnow.return_value = self.now + timedelta(seconds=45)
+        self.assertEqual(len(self.persist.get_all()), 0)
+        self.assertEqual(self.persist.stale_heap, [])
+
+    @mock.patch("taky.cot.persistence.memstore.dt")
+    @mock.patch("taky.cot.models.event.dt")
+    def test_get_all_wire(self, mock_dt1, mock_dt2):
+        mock_dt1.utcnow = mock.Mock(return_value=self.now)
+        mock_dt2.utcnow = mock.Mock(return_value=self.now)
+
+        evt_a = self.event("a", 10)
+        evt_b = self.event("b", 20)
+        self.persist.track(evt_a)
+        self.persist.track(evt_b)
+
+        wire = self.persist.get_all_wire()
+        self.assertEqual(wire, evt_a.as_bytes + evt_b.as_bytes)
+        self.assertIs(wire, self.persist.get_all_wire())
+        self.assertEqual(self.persist.get_all_wire(exclude_uid="a"), evt_b.as_bytes)
+
+        # Pruning an event rebuilds the snapshot on the next tick
+        mock_dt2.utcnow.return_value = self.now + timedelta(seconds=15)
+        self.assertEqual(self.persist.get_all_wire(), wire)
+        self.persist.flush()
+        self.assertEqual(self.persist.get_all_wire(), evt_b.as_bytes)
+
+    @mock.patch("taky.cot.persistence.memstore.dt")
+    @mock.patch("taky.cot.models.event.dt")
+    def test_get_all_wire_changed(self, mock_dt1, mock_dt2):
+        mock_dt1.utcnow = mock.Mock(return_value=self.now)
+        mock_dt2.utcnow = mock.Mock(return_value=self.now)
+
+        evt_a = self.event("a", 10)
+        evt_b = self.event("b", 20)
+        self.persist.track(evt_a)
+        self.persist.track(evt_b)
+        wire = self.persist.get_all_wire()
+
+        # Within a tick, only the changed event is serialized
+        evt_a2 = self.event("a", 30)
+        self.persist.track(evt_a2)
+        with mock.patch.object(
+            self.persist, "_wire", wraps=self.persist._wire
+        ) as mock_wire:
+            self.assertEqual(self.persist.get_all_wire(), wire + evt_a2.as_bytes)
+            self.assertEqual(mock_wire.call_count, 1)
+
+            self.persist.flush()
+            self.assertEqual(
+                self.persist.get_all_wire(), evt_b.as_bytes + evt_a2.as_bytes
+            )
+            self.assertEqual(mock_wire.call_count, 3)
+
+    @mock.patch("taky.cot.persistence.base.time")
+    @mock.patch("taky.cot.persistence.memstore.dt")
+    @mock.patch("taky.cot.models.event.dt")
+    def test_duplicates(self, mock_dt1, mock_dt2, mock_time):
+        mock_dt1.utcnow = mock.Mock(return_value=self.now)
+        mock_dt2.utcnow = mock.Mock(return_value=self.now)
+        mock_time.time = mock.Mock(return_value=1000)
+
+        self.assertFalse(self.persist.track(self.event("a", 100)))
+        # Unchanged, and the stored copy is good for more than half the TTL
+        mock_time.time.return_value = 1040
+        self.assertTrue(self.persist.track(self.event("a", 100)))
+        self.assertEqual(self.persist.status()["duplicates"], 1)
+
+        # The stored copy is too close to its stale time, so write it again
+        mock_time.time.return_value = 1060
+        self.assertFalse(self.persist.track(self.event("a", 100)))
+
+        # A shorter stale time is written, even if the content is unchanged
+        mock_time.time.return_value = 1070
+        self.assertTrue(self.persist.track(self.event("a", 100)))
+        shorter = self.event("a", 50)
+        self.assertFalse(self.persist.track(shorter))
+        self.assertEqual(self.persist.get_event("a").stale, shorter.stale)
+        self.assertTrue(self.persist.track(self.event("a", 50)))
+
+        # Changed content is always written
+        evt = self.event("a", 100)
+        evt.point.lat = 12.5
+        self.assertFalse(self.persist.track(evt))
+        self.assertEqual(self.persist.get_event("a").point.lat, 12.5)
+
+    @mock.patch("taky.cot.persistence.memstore.dt")
+    @mock.patch("taky.cot.models.event.dt")
+    def test_binary(self, mock_dt1, mock_dt2):
+        mock_dt1.utcnow = mock.Mock(return_value=self.now)
+        mock_dt2.utcnow = mock.Mock(return_value=self.now)
+        self.persist = Persistence(binary=True)
+
+        evt_a = self.event("a", 10)
+        evt_b = self.event("b", 20)
+        self.persist.track(evt_a)
+        self.persist.track(evt_b)
+
+        self.assertEqual(self.persist.get_all_wire(), evt_a.as_bytes + evt_b.as_bytes)
+        self.assertEqual(self.persist.get_event("b").detail.callsign, "JENNY")
+        self.assertGreater(self.persist.status()["binary_saved"], 0)
+
+        mock_dt2.utcnow.return_value = self.now + timedelta(seconds=15)
+        self.assertEqual([evt.uid for evt in self.persist.get_all()], ["b"])
+
+
+class SqlitePersistenceTestcase(ut.TestCase):
+    def setUp(self):
+        load_config(os.devnull)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "persist.db")
+        self.persist = SqlitePersistence(self.path)
+
+    def tearDown(self):
+        self.persist.close()
+        self.tmp.cleanup()
+
+    def event(self, uid, stale_s):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        evt.uid = uid
+        evt.etype = "a-u-G"
+        evt.stale = dt.utcnow() + timedelta(seconds=stale_s)
+        return evt
+
+    def test_reopen(self):
+        evt_a = self.event("a", 60)
+        evt_b = self.event("b", 60)
+        self.persist.track(evt_a)
+        self.persist.track(evt_b)
+
+        # Writes are batched until the next flush
+        self.assertEqual(
+            self.persist.status(), {"duplicates": 0, "events": 0, "pending": 2}
+        )
+        self.persist.flush()
+        self.assertEqual(
+            self.persist.status(), {"duplicates": 0, "events": 2, "pending": 0}
+        )
+
+        self.persist.close()
+        self.persist = SqlitePersistence(self.path)
+        self.assertEqual({evt.uid for evt in self.persist.get_all()}, {"a", "b"})
+        self.assertEqual(self.persist.get_event("a").as_bytes, evt_a.as_bytes)
+        self.assertEqual(self.persist.get_all_wire(exclude_uid="a"), evt_b.as_bytes)
+
+    def test_binary(self):
+        self.persist.close()
+        self.persist = SqlitePersistence(self.path, binary=True)
+
+        evt = self.event("a", 60)
+        self.persist.track(evt)
+        self.assertEqual(self.persist.get_all_wire(), evt.as_bytes)
+        self.assertEqual(self.persist.get_event("a").uid, "a")
+        self.assertGreater(self.persist.status()["binary_written_saved"], 0)
+
+    @mock.patch("taky.cot.persistence.sqlitestore.time")
+    def test_prune(self, mock_time):
+        mock_time.time = mock.Mock(return_value=1000)
+
+        self.persist.track(self.event("a", 10))
+        self.persist.track(self.event("b", 30))
+        self.assertEqual(len(list(self.persist.get_all())), 2)
+
+        mock_time.time.return_value = 1020
+        self.assertEqual([evt.uid for evt in self.persist.get_all()], ["b"])
+        self.assertIsNone(self.persist.get_event("a"))
+
+        self.persist.prune()
+        self.assertEqual(self.persist.status()["events"], 1)
+
+    def test_purge_invalid(self):
+        self.persist.track(self.event("a", 60))
+        self.persist.track(self.event("b", 60))
+        self.persist.flush()
+        self.persist.db.execute("UPDATE events SET xml = ? WHERE uid = 'b'", (b"<x",))
+
+        with self.assertLogs(self.persist.lgr, "WARNING"):
+            self.assertIsNone(self.persist.get_event("b"))
+        self.assertEqual([evt.uid for evt in self.persist.get_all()], ["a"])
+        self.assertEqual(self.persist.status()["events"], 1)
@@ -0,0 +1,55 @@
+import os
+import unittest as ut
+
+from taky.config import load_config, app_config
+from taky.cot.persistence import kept_types_matcher
+from taky.util import PrefixMatcher
+
+
+class PrefixMatcherTestcase(ut.TestCase):
+    def test_match(self):
+        matcher = PrefixMatcher(["a-", "b-m-p", "b-m-p-s"])
+
+        self.assertTrue(matcher.match("a-f-G-U-C"))
+        self.assertTrue(matcher.match("b-m-p-s-p-i"))
+        self.assertTrue(matcher.match("b-m-p"))
+        self.assertFalse(matcher.match("b-t-f"))
+        self.assertFalse(matcher.match("ta-"))
+        self.assertFalse(matcher.match(""))
+
+        # Results are cached
+        self.assertEqual(
+            matcher.cache,
+            {
+                "a-f-G-U-C": True,
+                "b-m-p-s-p-i": True,
+                "b-m-p": True,
+                "b-t-f": False,
+                "ta-": False,
+                "": False,
+            },
+        )
+
+    def test_regex_chars(self):
+        matcher = PrefixMatcher(["a.b"])
+        self.assertTrue(matcher.match("a.b-c"))
+        self.assertFalse(matcher.match("axb-c"))
+
+    def test_empty(self):
+        self.assertFalse(PrefixMatcher([]).match("a-f-G"))
+
+    def test_cache_size(self):
+        matcher = PrefixMatcher(["a-"], cache_size=2)
+        for etype in ["a-1", "a-2", "a-3"]:
+            matcher.match(etype)
+        self.assertEqual(matcher.cache, {"a-3": True})
+
+    def test_kept_types(self):
+        load_config(os.devnull)
+        self.assertTrue(kept_types_matcher().match("u-d-c"))
+
+        app_config.set("persistence", "kept_types", "b-t-f, u-d-r")
+        matcher = kept_types_matcher()
+        self.assertEqual(matcher.prefixes, ("b-t-f", "u-d-r"))
+        self.assertFalse(matcher.match("a-f-G"))
+        self.assertIs(matcher, kept_types_matcher())
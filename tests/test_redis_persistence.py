@@ -0,0 +1,370 @@
+import os
+import time
+import threading
+import unittest as ut
+from unittest import mock
+
+from lxml import etree
+import redis
+
+from taky.config import load_config
+from taky.cot import models
+from taky.cot.persistence import RedisPersistence
+from . import XML_S
+
+
+class FakePipeline:
+    """
+    Records commands, and runs them against the FakeRedis on execute()
+    """
+
+    def __init__(self, rds):
+        self.rds = rds
+        self.cmds = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.cmds.append((name, args, kwargs))
+
+        return queue
+
+    def execute(self):
+        self.rds.executed.append([name for (name, _, _) in self.cmds])
+
+        # Let a test hold the write behind thread mid-write
+        self.rds.blocked.set()
+        self.rds.gate.wait(5)
+
+        if self.rds.fail:
+            self.rds.fail -= 1
+            raise self.rds.fail_exc("Write failed")
+
+        return [getattr(self.rds, name)(*args, **kw) for (name, args, kw) in self.cmds]
+
+
+class FakeRedis:
+    """
+    Just enough of StrictRedis for RedisPersistence. Keys and members are
+    returned as bytes, as redis-py does.
+    """
+
+    @staticmethod
+    def key(key):
+        if isinstance(key, bytes):
+            return key.decode()
+        return key
+
+    def __init__(self):
+        self.kv = {}
+        self.ttls = {}
+        self.zsets = {}
+        self.executed = []
+        self.fail = 0
+        self.fail_exc = redis.ConnectionError
+        self.gate = threading.Event()
+        self.gate.set()
+        self.blocked = threading.Event()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def set(self, key, val, ex=None):
+        key = self.key(key)
+        self.kv[key] = val
+        self.ttls[key] = ex if ex else -1
+        return True
+
+    def get(self, key):
+        return self.kv.get(self.key(key))
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def exists(self, key):
+        key = self.key(key)
+        return int(key in self.kv or bool(self.zsets.get(key)))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.kv.pop(self.key(key), None)
+
+    def ttl(self, key):
+        return self.ttls.get(self.key(key), -2)
+
+    def scan_iter(self, match, count=None):
+        prefix = match[:-1]
+        return [key.encode() for key in self.kv if key.startswith(prefix)]
+
+    def zadd(self, name, mapping):
+        zset = self.zsets.setdefault(name, {})
+        for (member, score) in mapping.items():
+            zset[self.key(member)] = score
+
+    def zcard(self, name):
+        return len(self.zsets.get(name, {}))
+
+    def zrem(self, name, *members):
+        for member in members:
+            self.zsets.get(name, {}).pop(member, None)
+
+    def zrangebyscore(self, name, low, high, withscores=False):
+        low = float(low)
+        items = sorted(self.zsets.get(name, {}).items(), key=lambda item: item[1])
+        ret = [(member.encode(), score) for (member, score) in items if score >= low]
+        if withscores:
+            return ret
+        return [member for (member, _) in ret]
+
+    def zremrangebyscore(self, name, low, high):
+        zset = self.zsets.get(name, {})
+        for member in [member for (member, score) in zset.items() if score <= high]:
+            del zset[member]
+
+
+class RedisPersistenceTestcase(ut.TestCase):
+    def setUp(self):
+        load_config(os.devnull)
+        self.rds = FakeRedis()
+        patcher = mock.patch(
+            "taky.cot.persistence.redisstore.redis.StrictRedis", return_value=self.rds
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.persist = None
+
+    def tearDown(self):
+        self.rds.gate.set()
+        if self.persist:
+            self.persist.close()
+
+    def build(self, **kwargs):
+        self.persist = RedisPersistence("test", **kwargs)
+        return self.persist
+
+    @staticmethod
+    def event(uid):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        evt.uid = uid
+        return evt
+
+    def stored(self):
+        """
+        The UIDs of the events in Redis
+        """
+        prefix = "taky:test:persist:"
+        return sorted(
+            key[len(prefix) :] for key in self.rds.kv if key.startswith(prefix)
+        )
+
+    def test_track(self):
+        persist = self.build()
+        persist.track_event(self.event("a"), 60)
+
+        self.assertEqual(self.rds.ttls["taky:test:persist:a"], 60)
+        self.assertEqual(list(self.rds.zsets["taky:test:persist_idx"]), ["a"])
+        self.assertEqual(persist.get_event("a").uid, "a")
+        self.assertIsNone(persist.get_event("b"))
+
+    def test_write_behind(self):
+        persist = self.build(write_behind=True, queue_max=2)
+
+        # Hold the thread while it writes the first event
+        self.rds.gate.clear()
+        persist.track_event(self.event("a"), 60)
+        self.assertTrue(self.rds.blocked.wait(5))
+
+        persist.track_event(self.event("b"), 60)
+        persist.track_event(self.event("b"), 60)
+        persist.track_event(self.event("c"), 60)
+        persist.track_event(self.event("d"), 60)
+
+        # Queued events are read back before they are written
+        self.assertEqual(persist.get_event("b").uid, "b")
+        self.assertEqual(self.stored(), [])
+
+        self.rds.gate.set()
+        persist.close()
+        self.assertEqual(self.stored(), ["a", "b", "c"])
+
+        self.assertEqual(persist.wb_stats["queued"], 3)
+        self.assertEqual(persist.wb_stats["coalesced"], 1)
+        self.assertEqual(persist.wb_stats["dropped"], 1)
+        self.assertEqual(persist.wb_queue, {})
+
+    def test_write_behind_requeue(self):
+        persist = self.build(write_behind=True)
+
+        # The first write fails, after a newer event has been queued
+        self.rds.gate.clear()
+        self.rds.fail = 1
+        old = self.event("a")
+        persist.track_event(old, 60)
+        self.assertTrue(self.rds.blocked.wait(5))
+
+        new = self.event("a")
+        new.etype = "a-h-G"
+        persist.track_event(new, 60)
+        self.rds.gate.set()
+
+        # The thread waits a second before trying again
+        key = "taky:test:persist:a"
+        for _ in range(30):
+            if persist.rds_ok and self.rds.kv.get(key):
+                break
+            time.sleep(0.1)
+        self.assertEqual(self.rds.kv[key], new.as_bytes)
+        self.assertEqual(self.rds.executed, [["set", "zadd"], ["set", "zadd"]])
+        self.assertTrue(persist.rds_ok)
+
+    def wait_stored(self, uids):
+        for _ in range(30):
+            if self.stored() == uids:
+                return
+            time.sleep(0.1)
+        self.assertEqual(self.stored(), uids)
+
+    def test_write_behind_timeout(self):
+        persist = self.build(write_behind=True)
+
+        # A timeout is retried, like a lost connection
+        self.rds.fail = 1
+        self.rds.fail_exc = redis.TimeoutError
+        persist.track_event(self.event("a"), 60)
+        self.wait_stored(["a"])
+
+        persist.track_event(self.event("b"), 60)
+        self.wait_stored(["a", "b"])
+        self.assertTrue(persist.wb_thread.is_alive())
+
+    def test_write_behind_error_reply(self):
+        persist = self.build(write_behind=True)
+
+        # An error reply drops the batch, but the thread carries on
+        self.rds.fail = 1
+        self.rds.fail_exc = redis.ResponseError
+        with self.assertLogs(persist.lgr, "ERROR"):
+            persist.track_event(self.event("a"), 60)
+            for _ in range(30):
+                if persist.wb_stats["failed"]:
+                    break
+                time.sleep(0.1)
+        self.assertEqual(persist.wb_stats["failed"], 1)
+
+        persist.track_event(self.event("b"), 60)
+        self.wait_stored(["b"])
+
+    def test_close_timeout(self):
+        persist = self.build(write_behind=True)
+        persist.close_timeout = 0.1
+
+        # Redis never answers
+        self.rds.gate.clear()
+        persist.track_event(self.event("a"), 60)
+        self.assertTrue(self.rds.blocked.wait(5))
+        persist.track_event(self.event("b"), 60)
+
+        with self.assertLogs(persist.lgr, "WARNING") as logs:
+            persist.close()
+        self.assertIn("1 events not written", logs.output[0])
+        self.assertIsNone(persist.wb_thread)
+
+    def test_rebuild_index(self):
+        # Events written before the index existed
+        self.rds.set("taky:test:persist:a", XML_S, ex=60)
+        self.rds.set("taky:test:persist:b", XML_S)
+
+        self.build()
+        self.assertEqual(list(self.rds.zsets["taky:test:persist_idx"]), ["a"])
+        self.assertEqual(self.rds.get("taky:test:persist_idx_version"), b"1")
+
+        # The index is only rebuilt if it is missing, or out of date
+        with mock.patch.object(self.rds, "scan_iter", wraps=self.rds.scan_iter) as scan:
+            self.build()
+            scan.assert_not_called()
+
+            self.rds.set("taky:test:persist_idx_version", b"0")
+            self.build()
+            self.assertEqual(scan.call_count, 1)
+
+            del self.rds.zsets["taky:test:persist_idx"]
+            self.build()
+            self.assertEqual(scan.call_count, 2)
+            self.assertEqual(list(self.rds.zsets["taky:test:persist_idx"]), ["a"])
+
+    def test_mget_batches(self):
+        persist = self.build()
+        persist.batch_size = 2
+        for uid in "abcde":
+            persist.track_event(self.event(uid), 60)
+
+        self.rds.executed = []
+        uids = sorted(evt.uid for evt in persist.get_all())
+        self.assertEqual(uids, list("abcde"))
+        self.assertEqual(self.rds.executed, [["mget", "mget", "mget"]])
+
+    def test_missing_pruned(self):
+        persist = self.build()
+        for uid in "abc":
+            persist.track_event(self.event(uid), 60)
+
+        # The event was deleted, but its index entry is left
+        self.rds.delete("taky:test:persist:b")
+        uids = sorted(evt.uid for evt in persist.get_all())
+        self.assertEqual(uids, ["a", "c"])
+        self.assertEqual(sorted(self.rds.zsets["taky:test:persist_idx"]), ["a", "c"])
+
+    @mock.patch("taky.cot.persistence.redisstore.time")
+    def test_cache_ttl(self, mock_time):
+        mock_time.time.return_value = 1000
+        persist = self.build(cache_size=10, cache_ttl=30)
+        persist.track_event(self.event("a"), 60)
+
+        with mock.patch.object(self.rds, "get", wraps=self.rds.get) as get:
+            mock_time.time.return_value = 1020
+            self.assertEqual(persist.get_event("a").uid, "a")
+            get.assert_not_called()
+
+            # The cached copy is no longer trusted, though Redis still has it
+            mock_time.time.return_value = 1040
+            self.assertEqual(persist.get_event("a").uid, "a")
+            get.assert_called_once_with("taky:test:persist:a")
+
+        self.assertEqual(persist.cache_stats, {"hits": 1, "misses": 1})
+
+    def test_cache_lru(self):
+        persist = self.build(cache_size=2)
+        persist.track_event(self.event("a"), 60)
+        persist.track_event(self.event("b"), 60)
+
+        # Using "a" makes "b" the least recently used
+        persist.get_event("a")
+        persist.track_event(self.event("c"), 60)
+        self.assertEqual(list(persist.cache), ["a", "c"])
+
+        # Replays fill the cache from Redis
+        list(persist.get_all())
+        self.assertEqual(len(persist.cache), 2)
+        self.assertEqual(persist.status()["cached"], 2)
+
+    def test_keyspace_events(self):
+        persist = self.build(cache_size=10)
+        # As if subscribed to keyspace notifications
+        persist.notify_thread = mock.Mock()
+        prefix = b"__keyspace@0__:taky:test:persist:"
+        persist.notify_prefix_len = len(prefix)
+        msg = {"channel": prefix + b"a", "data": b"set"}
+
+        # The notification for our own write leaves the cache alone
+        persist.track_event(self.event("a"), 60)
+        persist._keyspace_event(msg)
+        self.assertIn("a", persist.cache)
+        self.assertEqual(persist.own_writes, {})
+
+        # Another writer changed the event
+        persist._keyspace_event(msg)
+        self.assertNotIn("a", persist.cache)
+
+        # A failed write expects no notification
+        self.rds.fail = 1
+        persist.track_event(self.event("b"), 60)
+        self.assertEqual(persist.own_writes, {})
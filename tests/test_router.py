@@ -139,3 +139,72 @@ class RouterTestcase(ut.TestCase):
         self.tk1.feed(msg)
         ret = self.tk2.queue.get_nowait()
         self.assertTrue(ret.uid == "EB77220E-6299-4CA3-95FC-0200BD9FE78A")
+
+    def test_pass_through(self):
+        """
+        Events which are not changed by the router are forwarded as received
+        """
+        self.router.client_connect(self.tk1)
+        self.router.client_connect(self.tk2)
+
+        elm = etree.fromstring(self.tk1_ident_msg)
+        elm.set("access", "Unclassified")
+        self.tk1.feed(etree.tostring(elm))
+
+        ret = self.tk2.queue.get_nowait()
+        self.assertEqual(ret.as_bytes, etree.tostring(elm))
+
+    def test_index_update(self):
+        self.router.client_connect(self.tk1)
+        self.tk1.feed(self.tk1_ident_msg)
+        self.assertEqual(self.router.by_group[models.Teams.CYAN], {self.tk1})
+
+        # The client changes callsign and team
+        elm = etree.fromstring(self.tk1_ident_msg)
+        elm.find("detail/contact").set("callsign", "JOKER")
+        elm.find("detail/__group").set("name", "Red")
+        self.tk1.feed(etree.tostring(elm))
+
+        self.assertEqual(len(list(self.router.find_clients(callsign="JENNY"))), 0)
+        self.assertEqual(len(list(self.router.find_clients(callsign="JOKER"))), 1)
+        self.assertNotIn(models.Teams.CYAN, self.router.by_group)
+        self.assertEqual(self.router.by_group[models.Teams.RED], {self.tk1})
+
+        self.router.client_disconnect(self.tk1)
+        self.assertEqual(len(list(self.router.find_clients(uid="ANDROID-deadbeef"))), 0)
+        self.assertEqual(self.router.by_group, {})
+
+    def test_suppress_duplicates(self):
+        app_config.set("cot_server", "suppress_duplicates", "true")
+        self.router = cot.COTRouter()
+        self.tk1.route = self.router.route
+        self.router.client_connect(self.tk1)
+        self.router.client_connect(self.tk2)
+
+        # The re-broadcast is unchanged, so tk2 only gets the first copy
+        self.tk1.feed(self.tk1_ident_msg)
+        self.tk1.feed(self.tk1_ident_msg)
+        self.tk2.queue.get_nowait()
+        self.assertRaises(queue.Empty, self.tk2.queue.get_nowait)
+
+    def test_malformed(self):
+        """
+        Events with an invalid field are dropped before they are sent anywhere
+        """
+        peer = UnittestTAKClient()
+        self.router.add_peer(peer)
+        self.router.client_connect(self.tk1)
+        self.router.client_connect(self.tk2)
+
+        for (path, attr, value) in [
+            (".", "stale", "garbage"),
+            ("point", "lat", "north"),
+            ("detail/track", "speed", "fast"),
+        ]:
+            elm = etree.fromstring(self.tk1_ident_msg)
+            elm.find(path).set(attr, value)
+            self.tk1.feed(etree.tostring(elm))
+
+        self.assertRaises(queue.Empty, self.tk2.queue.get_nowait)
+        self.assertRaises(queue.Empty, peer.queue.get_nowait)
+        self.assertEqual(list(self.router.persist.get_all()), [])
@@ -0,0 +1,119 @@
+import os
+import socket
+import tempfile
+import unittest as ut
+from unittest import mock
+
+from taky.config import load_config, app_config
+from taky.cot import COTServer
+from . import XML_S
+
+
+class COTServerTestcase(ut.TestCase):
+    def setUp(self):
+        load_config(os.devnull)
+        self.tmp = tempfile.TemporaryDirectory()
+        app_config.set("taky", "redis", "false")
+        app_config.set("taky", "root_dir", self.tmp.name)
+        app_config.set("taky", "bind_ip", "127.0.0.1")
+        app_config.set("cot_server", "port", "0")
+        app_config.set("cot_server", "log_cot", None)
+
+        self.server = COTServer()
+        self.server.sock_setup()
+        self.addr = self.server.srv.getsockname()
+        self.socks = []
+
+    def tearDown(self):
+        for sock in self.socks:
+            sock.close()
+        self.server.shutdown()
+        self.tmp.cleanup()
+
+    def connect(self, sock=None):
+        """
+        Connect to the server, and run the loop until the client is accepted
+        """
+        if sock is None:
+            sock = self.open()
+        self.run_until(lambda: self.client_for(sock) is not None)
+        return (sock, self.client_for(sock))
+
+    def open(self):
+        sock = socket.create_connection(self.addr, timeout=2)
+        self.socks.append(sock)
+        return sock
+
+    def client_for(self, sock):
+        for client in self.server.clients.values():
+            if client.addr == sock.getsockname():
+                return client
+        return None
+
+    def run_until(self, cond, tries=20):
+        for _ in range(tries):
+            self.server.loop()
+            if cond():
+                return
+        self.fail("Condition not met")
+
+    def test_route(self):
+        (sock1, _) = self.connect()
+        (sock2, client2) = self.connect()
+
+        sock1.sendall(XML_S)
+        sock2.setblocking(False)
+        data = bytearray()
+
+        def received():
+            try:
+                data.extend(sock2.recv(65536))
+            except BlockingIOError:
+                pass
+            return b"</event>" in data
+
+        self.run_until(received)
+        self.assertIn(b'uid="ANDROID-deadbeef"', data)
+        self.assertEqual(len(self.server.clients), 2)
+
+    def test_remote_close(self):
+        (sock, client) = self.connect()
+
+        sock.close()
+        self.run_until(lambda: client.sock not in self.server.clients)
+        self.assertTrue(client.is_closed)
+
+    def test_closed_outside_loop(self):
+        """
+        A client closed without going through the server is replaced by the
+        next client to get its descriptor
+        """
+        (_, stale) = self.connect()
+        stale_fd = stale.sock_fd
+        # Open the next connection first, so only the server reuses the fd
+        sock = self.open()
+        stale.sock.close()
+
+        (_, client) = self.connect(sock)
+        self.assertEqual(client.sock_fd, stale_fd)
+        self.assertFalse(client.is_closed)
+        self.assertNotIn(stale.sock, self.server.clients)
+        self.assertIs(self.server.sel.get_key(client.sock_fd).data, client)
+
+    def test_rx_pending(self):
+        (sock, client) = self.connect()
+        client.rx_buff = bytearray(512)
+        client.rx_view = memoryview(client.rx_buff)
+        client.rx_budget = 1024
+
+        # The client runs out of budget, and is served again without waiting
+        sock.sendall(XML_S * 50)
+        self.run_until(lambda: client in self.server.rx_pending)
+        with mock.patch.object(
+            self.server.sel, "select", wraps=self.server.sel.select
+        ) as select:
+            self.server.loop()
+            select.assert_called_once_with(0)
+
+        self.run_until(lambda: client.num_rx == 50, tries=100)
+        self.assertFalse(self.server.rx_pending)
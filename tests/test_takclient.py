@@ -1,8 +1,12 @@
 import os
+import ssl
 import unittest as ut
 import mock
+from lxml import etree
 
 from taky import cot
+from taky.cot import models
+from taky.cot.aioserver import AsyncTAKClient
 from taky.config import load_config, app_config
 
 from .test_cot_event import XML_S
@@ -35,7 +39,7 @@ class SocketTAKClientTest(ut.TestCase):
 
         self.mock_sock = mock.patch("socket.socket")
         self.sock = self.mock_sock.start()
-        self.sock.recv.return_value = b"</invalid>"
+        self.sock.recv_into.side_effect = self.recv_into
         self.sock.getpeername.return_value = (
             "127.0.0.1",
             12345,
@@ -43,9 +47,254 @@ class SocketTAKClientTest(ut.TestCase):
 
         self.tk = cot.SocketTAKClient(sock=self.sock, use_ssl=False, router=router)
 
+    @staticmethod
+    def recv_into(buff):
+        data = b"</invalid>"
+        buff[0 : len(data)] = data
+        return len(data)
+
     def test_invalid_xml(self):
         self.tk.socket_rx()
         self.sock.close.assert_called()
 
+    def stream_rx(self, data, record=None, exc=BlockingIOError):
+        """
+        Serve data from recv_into(), at most record bytes per read, until it
+        runs out and exc is raised
+        """
+        data = bytearray(data)
+
+        def recv_into(buff):
+            if not data:
+                raise exc()
+            nbytes = min(len(buff), record or len(buff), len(data))
+            buff[:nbytes] = data[:nbytes]
+            del data[:nbytes]
+            return nbytes
+
+        self.sock.recv_into.side_effect = recv_into
+        self.tk.rx_buff = bytearray(1024)
+        self.tk.rx_view = memoryview(self.tk.rx_buff)
+        self.tk.rx_budget = 4096
+        return data
+
+    def test_rx_budget(self):
+        data = self.stream_rx(XML_S * 20)
+
+        # Each call reads up to the budget, then asks to be served again
+        self.assertTrue(self.tk.socket_rx())
+        self.assertEqual(len(data), len(XML_S) * 20 - 4096)
+        while self.tk.socket_rx():
+            pass
+        self.assertEqual(len(data), 0)
+        self.assertEqual(self.tk.num_rx, 20)
+
+    def test_rx_budget_ssl(self):
+        # SSL reads return one record at a time, which is a short read
+        data = self.stream_rx(XML_S * 20, record=1000, exc=ssl.SSLWantReadError)
+        self.tk.ssl = True
+        self.tk.ssl_hs = cot.client.SSLState.SSL_ESTAB
+        self.sock.pending.return_value = 0
+
+        self.assertTrue(self.tk.socket_rx())
+        self.assertEqual(len(data), len(XML_S) * 20 - 5000)
+        while self.tk.socket_rx():
+            pass
+        self.assertEqual(self.tk.num_rx, 20)
+
+    def test_tx_budget(self):
+        for _ in range(200):
+            self.tk.send_data(b"a" * 100)
+        self.tk.tx_budget = 8000
+
+        # Each call sends TX_IOV_MAX chunks, and stops once over the budget
+        self.sock.sendmsg.side_effect = lambda bufs: sum(len(buf) for buf in bufs)
+        self.tk.socket_tx()
+        self.assertEqual(self.sock.sendmsg.call_count, 2)
+        self.assertEqual(self.tk.out_len, 20000 - 2 * 6400)
+        self.assertTrue(self.tk.has_data)
+
+    def test_tx_queue(self):
+        for chunk in [b"a" * 10, b"b" * 10, b"c" * 10]:
+            self.tk.send_data(chunk)
+        self.assertEqual(self.tk.out_len, 30)
+
+        # A partial send leaves the rest of the second chunk queued
+        self.sock.sendmsg.return_value = 15
+        self.tk.socket_tx()
+        bufs = self.sock.sendmsg.call_args[0][0]
+        self.assertEqual(b"".join(bufs), b"a" * 10 + b"b" * 10 + b"c" * 10)
+        self.assertEqual(self.tk.out_len, 15)
+
+        self.tk.socket_tx()
+        bufs = self.sock.sendmsg.call_args[0][0]
+        self.assertEqual(b"".join(bufs), b"b" * 5 + b"c" * 10)
+        self.assertEqual(self.tk.out_len, 0)
+        self.assertFalse(self.tk.has_data)
+
+    def test_slow_client_drop_oldest(self):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        self.tk.tx_high_water = len(evt.as_bytes) * 2
+        self.tk.tx_low_water = len(evt.as_bytes)
+
+        for _ in range(3):
+            self.tk.send_event(evt)
+
+        # The third event superseded the first two
+        self.assertTrue(self.tk.tx_congested)
+        self.assertEqual(self.tk.tx_dropped, 2)
+        self.assertEqual(len(self.tk.out_queue), 1)
+        self.assertEqual(self.tk.tx_queued, len(evt.as_bytes))
+
+        # The queue has drained to the low water mark
+        self.tk.send_event(evt)
+        self.assertFalse(self.tk.tx_congested)
+        self.assertEqual(len(self.tk.out_queue), 2)
+
+    def test_slow_client_drop_volatile(self):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        self.tk.tx_high_water = len(evt.as_bytes)
+        self.tk.tx_policy = "drop_volatile"
+
+        self.tk.send_event(evt)
+        evt.etype = "t-x-c-t-r"
+        self.tk.send_event(evt)
+
+        self.assertEqual(self.tk.tx_dropped, 1)
+        self.assertEqual(len(self.tk.out_queue), 1)
+
+    def test_slow_client_disconnect(self):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        self.tk.tx_high_water = len(evt.as_bytes)
+        self.tk.tx_policy = "disconnect"
+
+        self.tk.send_event(evt)
+        self.sock.close.assert_not_called()
+        self.tk.send_event(evt)
+        self.sock.close.assert_called()
+
+    def test_slow_client_disconnect_cb(self):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        self.tk.tx_high_water = len(evt.as_bytes)
+        self.tk.tx_policy = "disconnect"
+
+        # The server is asked to disconnect the client, so it stops tracking it
+        self.tk.disconnect_cb = mock.Mock()
+        self.tk.send_event(evt)
+        self.tk.send_event(evt)
+        self.tk.disconnect_cb.assert_called_once_with(self.tk, "Send queue full")
+        self.sock.close.assert_not_called()
+
+    def test_replay_exempt(self):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        self.tk.tx_high_water = len(evt.as_bytes) * 2
+        self.tk.tx_policy = "disconnect"
+        replay = evt.as_bytes * 10
+
+        # The replay alone is over the high water mark
+        self.tk.send_wire(replay)
+        self.tk.send_event(evt)
+        self.assertFalse(self.tk.tx_congested)
+        self.assertEqual(self.tk.tx_replay_queued, len(replay))
+
+        # Only the unsent part of the replay is exempt
+        self.sock.sendmsg.return_value = 100
+        self.tk.socket_tx()
+        self.assertEqual(self.tk.tx_replay_queued, len(replay) - 100)
+        self.tk.send_event(evt)
+        self.assertFalse(self.tk.tx_congested)
+        self.tk.send_event(evt)
+        self.assertTrue(self.tk.tx_congested)
+        self.sock.close.assert_called()
+
+    def test_coalesce(self):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        self.tk.tx_coalesce = True
+
+        self.tk.send_data(b"<other/>")
+        self.tk.send_event(evt)
+        evt.point.lat = 12.0
+        evt.invalidate()
+        self.tk.send_event(evt)
+
+        self.assertEqual(self.tk.tx_coalesced, 1)
+        self.assertEqual(len(self.tk.out_queue), 2)
+        self.assertEqual(self.tk.out_queue[1][0], evt.as_bytes)
+        self.assertEqual(self.tk.out_len, len(b"<other/>") + len(evt.as_bytes))
+
+        # Once sent, the next update is queued again
+        self.sock.sendmsg.return_value = self.tk.out_len
+        self.tk.socket_tx()
+        self.tk.send_event(evt)
+        self.assertEqual(len(self.tk.out_queue), 1)
+        self.assertEqual(self.tk.tx_coalesced, 1)
+
+    def test_ssl_blocked_write(self):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        self.tk.ssl = True
+        self.tk.ssl_hs = cot.client.SSLState.SSL_ESTAB
+        self.tk.tx_coalesce = True
+
+        sent = []
+
+        def send(buff):
+            sent.append(bytes(buff))
+            if len(sent) == 1:
+                raise ssl.SSLWantWriteError()
+            return len(buff)
+
+        self.sock.send.side_effect = send
+        self.tk.send_data(b"<other/>")
+        self.tk.send_event(evt)
+        self.tk.socket_tx()
+        self.assertEqual(sent, [b"<other/>" + evt.as_bytes])
+
+        # The event is part of the blocked write, so it is neither replaced,
+        # nor dropped
+        old_bytes = evt.as_bytes
+        evt.point.lat = 12.0
+        evt.invalidate()
+        self.tk.send_event(evt)
+        self.assertEqual(self.tk.tx_coalesced, 0)
+        self.assertEqual(self.tk.tx_drop(evt.uid), 1)
+        self.tk.send_event(evt)
+        self.assertEqual(len(self.tk.out_queue), 3)
+
+        # The retry sends the same bytes, then the update follows
+        self.tk.socket_tx()
+        self.assertEqual(sent[1], b"<other/>" + old_bytes)
+        self.assertEqual(sent[2], evt.as_bytes)
+        self.assertEqual(self.tk.out_len, 0)
+
     def tearDown(self):
         self.mock_sock.stop()
+
+
+class AsyncTAKClientTest(ut.TestCase):
+    def setUp(self):
+        load_config(os.devnull)
+        app_config.set("taky", "redis", "false")
+        self.writer = mock.Mock()
+        self.writer.is_closing.return_value = False
+        self.writer.get_extra_info.return_value = None
+        self.tk = AsyncTAKClient(mock.Mock(), self.writer)
+
+    def test_replay_exempt(self):
+        evt = models.Event.from_elm(etree.fromstring(XML_S))
+        self.tk.tx_high_water = len(evt.as_bytes) * 2
+        buffered = self.writer.transport.get_write_buffer_size
+
+        # The transport has sent 100 bytes of the replay
+        replay = evt.as_bytes * 10
+        self.tk.send_wire(replay)
+        buffered.return_value = len(replay) - 100
+        self.assertEqual(self.tk.tx_replay_queued, len(replay) - 100)
+
+        self.tk.send_event(evt)
+        buffered.return_value += len(evt.as_bytes)
+        self.assertEqual(self.tk.tx_replay_queued, len(replay) - 100)
+        self.assertFalse(self.tk.tx_congested)
+
+        # The replay is gone, only the event is left
+        buffered.return_value = len(evt.as_bytes)
+        self.assertEqual(self.tk.tx_replay_queued, 0)
@@ -36,3 +36,15 @@ class TAKUserTestcase(ut.TestCase):
         )
 
         self.assertTrue(elements_equal(self.answer, tak_u.as_element))
+
+    def test_repeated_elements(self):
+        # The last of a repeated element is used
+        detail = self.answer
+        etree.SubElement(detail, "contact", callsign="JOKER", endpoint="*:-1:stcp")
+        etree.SubElement(detail, "__group", role="Team Lead", name="Red")
+
+        tak_u = models.Event.detail_from_elm(detail, "TEST-deadbeef")
+        self.assertEqual(tak_u.callsign, "JOKER")
+        self.assertIsNone(tak_u.phone)
+        self.assertEqual(tak_u.group, models.Teams.RED)
+        self.assertEqual(tak_u.role, "Team Lead")